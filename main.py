@@ -1,12 +1,60 @@
 """main program entry"""
 
+import asyncio
+import json
 import os
+import re
 import tempfile
+import uuid
 
 import streamlit as st
 from pydantic import ValidationError
 
-from src import PDFValidator, workflow_run  # , load_data_to_bigquery
+from src import (  # , load_data_to_bigquery
+    LLM_CACHE_ENABLED,
+    PDFValidator,
+    clear_llm_clients,
+    enable_llm_cache,
+    workflow_run_batch,
+)
+from src.Cache import CACHE_EXPIRE_SECONDS, pdf_cache_key
+from src.Checkpoint import append_result, load_results, remove_results
+
+# A resume code is the hex uuid of a checkpoint file, so a code typed by the user can never point outside the
+# temporary directory.
+_RESUME_CODE = re.compile(r"[0-9a-f]{32}")
+
+
+def _valid_pdf_name(name: str) -> bool:
+    """Cheap check of an uploaded file name, done before any of its bytes are used.
+    Args:
+        name (str): The name of the uploaded file.
+    Returns:
+        bool: True if the name has a pdf extension and no path separators.
+    """
+    return PDFValidator.is_pdf(name) and "/" not in name and "\\" not in name
+
+
+def _session_resume_code() -> str:
+    """Returns the resume code of the upload of the current streamlit session.
+    Every upload gets a new random code, so the results of a user are never read nor
+    downloaded by another one, unless they were given the code.
+    Returns:
+        str: The resume code of the session.
+    """
+    if "resume_code" not in st.session_state:
+        st.session_state["resume_code"] = uuid.uuid4().hex
+    return st.session_state["resume_code"]
+
+
+def _checkpoint_path(resume_code: str) -> str:
+    """Returns the path of the checkpoint file of a resume code.
+    Args:
+        resume_code (str): A code matching _RESUME_CODE.
+    Returns:
+        str: The path of the JSONL checkpoint file in the temporary directory.
+    """
+    return os.path.join(tempfile.gettempdir(), f"results_{resume_code}.jsonl")
 
 
 # Streamlit app
@@ -15,13 +63,20 @@ def main():
 
     This function initializes the Streamlit app, allowing users to upload PDF files
     for processing. It handles user input for the OpenAI API key, validates uploaded
-    files, and processes each PDF using the LangGraph workflow. The results are displayed
-    to the user, and any temporary files are cleaned up after processing.
+    files, and processes the PDFs concurrently using the LangGraph workflow. The results are displayed
+    to the user. The PDFs are read straight from the upload buffers, only large ones are briefly spilled to disk for the
+    page workers.
     Steps:
         1. User inputs their OpenAI API key.
-        2. User uploads one or more PDF files.
-        3. Each uploaded PDF is validated and processed.
-        4. Results are displayed, and temporary files are deleted.
+        2. User uploads one or more PDF files. Files with an invalid name are skipped with a warning.
+        3. The uploaded PDFs are validated and processed as one asynchronous batch.
+        4. Results are displayed, and the API key is deleted. The results stay in the result cache (see src/Cache.py)
+           until they expire, and the user is told so. Every successful result is also appended to a JSONL
+           checkpoint as soon as it completes. The checkpoint is identified by the resume code shown before the
+           processing starts: if the session dies, uploading the same files again with that code, even from a new
+           session, skips the pdfs already processed and shows their stored results with the new ones. The
+           checkpoint is deleted once the batch is complete, and the results of the uploaded batch can be
+           downloaded as JSONL.
     Raises:
         ValidationError: If the uploaded PDF file does not meet validation criteria.
         Exception: If any other error occurs during processing.
@@ -31,9 +86,13 @@ def main():
     """
     st.title("LangGraph PDF Processor")
 
+    # The cache of identical llm calls is only used when enabled with LLM_CACHE_ENABLED=1
+    if LLM_CACHE_ENABLED:
+        enable_llm_cache()
+
     # Step 1: API Key Input and GC JSON credentials
     api_key = st.text_input(
-        "Enter your OpenAI API Key (Don´t worry, we delete your info after the process):",
+        "Enter your OpenAI API Key (Don´t worry, we delete it after the process):",
         type="password",
     )
     if st.button(
@@ -79,53 +138,108 @@ def main():
     uploaded_files = st.file_uploader(
         "Upload PDF files", type=["pdf"], accept_multiple_files=True
     )
+    resume_code = (
+        st.text_input("Resume code of an interrupted upload (optional):")
+        .strip()
+        .lower()
+    )
+    if resume_code and not _RESUME_CODE.fullmatch(resume_code):
+        st.warning("Ignoring the resume code, it is not a valid code.")
+        resume_code = ""
+    if uploaded_files:
+        # Reject the bad file names at the UI layer, so their content is never buffered nor hashed
+        rejected = [f.name for f in uploaded_files if not _valid_pdf_name(f.name)]
+        if rejected:
+            st.warning(f"Skipping files that are not valid PDFs: {', '.join(rejected)}")
+        uploaded_files = [f for f in uploaded_files if _valid_pdf_name(f.name)]
+
     if uploaded_files:
         os.environ["OPENAI_API_KEY"] = api_key
-        results = []
 
         try:
+            # Validate the uploaded files
             for uploaded_file in uploaded_files:
-                # Validate the uploaded file
                 PDFValidator(file_name=uploaded_file.name)
 
-                # Save uploaded file temporarily
-                temp_dir = tempfile.TemporaryDirectory()
-                temp_path = os.path.join(temp_dir.name, uploaded_file.name)
-                with open(temp_path, "wb") as f:
-                    f.write(uploaded_file.getbuffer())
-
-                # Process with LangGraph
-                st.info(f"Processing {uploaded_file.name}...")
-                result = workflow_run(
-                    pdf_path=temp_path
-                )  # LangGraph will use the environment variable
-                results.append((uploaded_file.name, result))
-
-                # Cleanup: Delete the temporary file
-                os.remove(temp_path)
-                temp_dir.cleanup()
-
-            # Cleanup: Delete the API key from the environment
-            del os.environ["OPENAI_API_KEY"]
+            # Skip the pdfs whose result is already in the checkpoint of an interrupted run, their stored result is shown
+            resume_code = resume_code or _session_resume_code()
+            checkpoint_path = _checkpoint_path(resume_code)
+            done = load_results(checkpoint_path)
+            keys = [pdf_cache_key(uploaded_file) for uploaded_file in uploaded_files]
+            skipped = [f.name for f, key in zip(uploaded_files, keys) if key in done]
+            if skipped:
+                st.info(
+                    f"Already processed, showing the stored results of: {', '.join(skipped)}"
+                )
+            pending = [
+                (f, key) for f, key in zip(uploaded_files, keys) if key not in done
+            ]
+
+            def checkpoint(position, result):
+                """Appends every successful result to the checkpoint as soon as it completes."""
+                if result["status"] == "success":
+                    append_result(pending[position][1], result, checkpoint_path)
+
+            # Process with LangGraph, all the LLM calls are in flight at the same time
+            st.info(
+                f"Processing {len(pending)} file(s)... If the page closes before the end, upload the same files "
+                f"again with the resume code {resume_code} to keep the finished ones."
+            )
+            batch_results = asyncio.run(
+                workflow_run_batch(
+                    [f for f, _ in pending],
+                    on_result=checkpoint,
+                    keys=[key for _, key in pending],
+                )
+            )  # LangGraph will use the environment variable
+            new_results = iter(batch_results)
+            results = [
+                (f.name, key, done[key] if key in done else next(new_results))
+                for f, key in zip(uploaded_files, keys)
+            ]
+
+            # The batch is complete, its checkpoint is no longer needed and the next upload gets a new code
+            remove_results(checkpoint_path)
+            st.session_state.pop("resume_code", None)
 
             # Display Results
-            st.info("Deleting your files and API key from our system.")
+            st.info(
+                "Deleting your files and API key from our system. The extracted information is kept in a cache, "
+                f"keyed by the content of each PDF, for {CACHE_EXPIRE_SECONDS // (24 * 60 * 60)} days, so the same "
+                "files are not sent to the LLM again when uploaded again."
+            )
             st.success("Processing complete!")
-            for file_name, result in results:
+            for file_name, _, result in results:
                 st.write(f"**{file_name}:**", result)
 
-                # for result_name,  result in results:
-
-                #    load_data_to_bigquery(project_id=project_id, dataset_id=dataset_id, table_id= table_id, data= result["extracted_info"])
-                #    st.info(f"{result_name} successfully uploaded")
-                #    del os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
-                #    st.info("Data loaded to BigQuery")
-                # st.success("Data successfully loaded.")
+            # Only the results of this batch are downloaded
+            st.download_button(
+                "Download the results (JSONL)",
+                data="".join(
+                    json.dumps({"key": key, "file_name": file_name, "result": result})
+                    + "\n"
+                    for file_name, key, result in results
+                ),
+                file_name="results.jsonl",
+                mime="application/jsonl",
+            )
+
+            # for result_name,  result in results:
+
+            #    load_data_to_bigquery(project_id=project_id, dataset_id=dataset_id, table_id= table_id, data= result["extracted_info"])
+            #    st.info(f"{result_name} successfully uploaded")
+            #    del os.environ["GOOGLE_APPLICATION_CREDENTIALS"]
+            #    st.info("Data loaded to BigQuery")
+            # st.success("Data successfully loaded.")
 
         except ValidationError as e:
             st.error(f"Validation error: {e}")
         except Exception as e:
             st.error(f"An error occurred: {e}")
+        finally:
+            # Cleanup: Delete the API key from the environment and from the cached LLM clients, even if the run failed
+            os.environ.pop("OPENAI_API_KEY", None)
+            clear_llm_clients()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,108 @@
+"""
+Micro-batching module for the LLM extraction.
+Instead of paying one request (and one copy of the system prompt) per pdf, the texts submitted by the graph nodes are
+accumulated and sent to the LLM together.
+it includes:
+1. class BatchingExtractor(Generic[T]): collects the submitted texts in a queue and hands them to a batch extraction function once
+batch_size texts are waiting or max_wait_ms have passed since the first one arrived. Every caller gets a Future with the
+result for its own text.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Generic, List, Optional, Tuple, TypeVar
+
+# The result type of the extraction of one text, e.g. a BigQueryEntry.
+T = TypeVar("T")
+
+
+class BatchingExtractor(Generic[T]):
+    """Dynamic batcher for the extraction LLM calls.
+
+    The graph nodes are synchronous and run in worker threads, so the batcher uses a
+    thread-safe queue and a background worker thread. A batch is flushed when it
+    reaches `batch_size` texts or when `max_wait_ms` milliseconds have passed since
+    its first text arrived, whichever comes first.
+
+    Attributes:
+        extract_batch (Callable[[List[str]], List[T]]): The function that extracts
+            the information of several texts with a single LLM call. It must return
+            one result per text, in the same order.
+        batch_size (int): The maximum number of texts sent in one LLM call.
+        max_wait_ms (float): The maximum time, in milliseconds, a text waits for
+            other texts before its batch is sent.
+    """
+
+    def __init__(
+        self,
+        extract_batch: Callable[[List[str]], List[T]],
+        batch_size: int,
+        max_wait_ms: float,
+    ) -> None:
+        """Initializes the batcher. The worker thread is started on the first submit.
+        Args:
+            extract_batch (Callable[[List[str]], List[T]]): The batch extraction function.
+            batch_size (int): The maximum number of texts sent in one LLM call.
+            max_wait_ms (float): The maximum time, in milliseconds, a text waits for a batch.
+        """
+        self.extract_batch = extract_batch
+        self.batch_size = batch_size
+        self.max_wait_ms = max_wait_ms
+        self._queue: "queue.Queue[Tuple[str, Future[T]]]" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, text: str) -> "Future[T]":
+        """Adds a text to the next batch.
+        Args:
+            text (str): The text to extract the information from.
+        Returns:
+            Future[T]: A future resolved with the extracted information of `text`, or
+                with the exception raised while extracting its batch.
+        """
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, daemon=True)
+                self._worker.start()
+
+        future: "Future[T]" = Future()
+        self._queue.put((text, future))
+        return future
+
+    def _next_batch(self) -> List[Tuple[str, "Future[T]"]]:
+        """Waits for the first text and collects the following ones until the batch is full or the time is up.
+        Returns:
+            List[Tuple[str, Future[T]]]: The texts of the batch with their futures.
+        """
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        """Worker loop: extracts every batch and resolves the futures of its texts."""
+        while True:
+            batch = self._next_batch()
+            texts = [text for text, _ in batch]
+            try:
+                results = self.extract_batch(texts)
+                if len(results) != len(texts):
+                    raise ValueError(
+                        f"Expected {len(texts)} extractions from the batch, got {len(results)}"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
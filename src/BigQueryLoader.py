@@ -5,13 +5,33 @@ it includes:
 1. The SCHEMA: design to be a static variable (Caps for that reason), takes the entries from the Graph and conform them
 to the schema expected by BigQuery Table.
 2.load_data_to_bigquery: THe function connected with the Google client and uploads the data into BIgQuery Tables.
+The table metadata is fetched (or the table created) only once per process, and large payloads are split in chunks
+of INSERT_BATCH_SIZE rows (by default) that are streamed concurrently.
+3.load_data_to_bigquery_batch: Loads the data with a single load job from newline-delimited JSON. Load jobs are not
+billed per row nor limited by the streaming quotas, so they are preferred for bulk uploads. Streaming inserts are kept
+for small, ad-hoc payloads.
 """
 
-from typing import Dict
+import io
+import json
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Tuple
 
-from google.api_core.exceptions import NotFound
+from google.api_core.exceptions import GoogleAPICallError, NotFound
 from google.cloud import bigquery
 
+logger = logging.getLogger(__name__)
+
+# Rows sent in each streaming insert request, and maximum number of requests in flight.
+INSERT_BATCH_SIZE = 500
+MAX_INSERT_WORKERS = 8
+
+# Tables already fetched or created, keyed by (project_id, dataset_id, table_id).
+_TABLE_CACHE: Dict[Tuple[str, str, str], bigquery.Table] = {}
+_TABLE_CACHE_LOCK = threading.Lock()
+
 # Define schema for the table in BigQuery
 SCHEMA = [
     bigquery.SchemaField("document_id", "STRING", mode="REQUIRED"),
@@ -26,14 +46,68 @@ SCHEMA = [
 ]
 
 
+def _get_or_create_table(
+    client: bigquery.Client, project_id: str, dataset_id: str, table_id: str
+) -> bigquery.Table:
+    """Returns the BigQuery table, creating it with SCHEMA if it does not exist.
+
+    The table is cached after the first call, so repeated loads into the same table
+    do not pay the metadata request again. The requests are made outside of the
+    cache lock, so the loads into other tables are not blocked while they wait, and
+    the first table stored wins when two threads miss the cache at the same time.
+    Args:
+        client (bigquery.Client): The BigQuery client used for the requests.
+        project_id (str): The Google Cloud project ID where the BigQuery dataset resides.
+        dataset_id (str): The ID of the BigQuery dataset where the table is located.
+        table_id (str): The ID of the BigQuery table.
+    Returns:
+        bigquery.Table: The existing or newly created table.
+    """
+    key = (project_id, dataset_id, table_id)
+    with _TABLE_CACHE_LOCK:
+        table = _TABLE_CACHE.get(key)
+    if table is not None:
+        return table
+
+    # Create table reference
+    table_ref = bigquery.DatasetReference(project_id, dataset_id).table(table_id)
+
+    # Check if table exists, if not create it
+    try:
+        table = client.get_table(table_ref)
+    except NotFound:
+        table = bigquery.Table(table_ref, schema=SCHEMA)
+        table = client.create_table(table, exists_ok=True)
+        logger.info(f"Table {table_id} created in dataset {dataset_id}.")
+
+    with _TABLE_CACHE_LOCK:
+        return _TABLE_CACHE.setdefault(key, table)
+
+
+def _evict_table(project_id: str, dataset_id: str, table_id: str) -> None:
+    """Removes a table from the cache, e.g. after it was dropped outside of this process.
+    Args:
+        project_id (str): The Google Cloud project ID where the BigQuery dataset resides.
+        dataset_id (str): The ID of the BigQuery dataset where the table is located.
+        table_id (str): The ID of the BigQuery table.
+    """
+    with _TABLE_CACHE_LOCK:
+        _TABLE_CACHE.pop((project_id, dataset_id, table_id), None)
+
+
 def load_data_to_bigquery(
-    project_id: str, dataset_id: str, table_id: str, data: Dict
+    project_id: str,
+    dataset_id: str,
+    table_id: str,
+    data: Dict,
+    batch_size: int = INSERT_BATCH_SIZE,
 ) -> None:
     """Loads data into a specified BigQuery table.
 
     This function connects to Google BigQuery and loads the provided data into
     the specified table. If the table does not exist, it will be created with
-    a predefined schema. The function also handles errors that may occur during
+    a predefined schema. The rows are streamed in chunks of `batch_size` rows,
+    sent concurrently. The function also handles errors that may occur during
     the insertion of data.
     Args:
         project_id (str): The Google Cloud project ID where the BigQuery dataset resides.
@@ -42,32 +116,97 @@ def load_data_to_bigquery(
         data (Dict): A dictionary containing the data to insert into the table.
                      It is expected to have a key "extracted_info" that holds
                      a list of dictionaries representing the rows to be inserted.
+        batch_size (int): The number of rows sent in each streaming insert request.
     Returns:
-        None: This function does not return a value. It prints messages indicating
+        None: This function does not return a value. It logs messages indicating
         the success or failure of the data insertion process.
     Raises:
+        ValueError: If `batch_size` is not a positive integer.
         google.cloud.exceptions.NotFound: If the specified dataset or table does not exist
         and cannot be created.
     """
+    if batch_size <= 0:
+        raise ValueError(f"batch_size must be a positive integer, got {batch_size}")
+
     client = bigquery.Client(project=project_id)  # type: ignore
+    table = _get_or_create_table(client, project_id, dataset_id, table_id)
 
-    # Create dataset reference
-    dataset_ref = bigquery.DatasetReference(dataset_id)  # type: ignore
+    rows = data["extracted_info"]
 
-    # Create table reference
-    table_ref = dataset_ref.table(table_id)
+    def insert_chunk(offset: int) -> List[Dict]:
+        """Streams the chunk of rows starting at `offset`.
+        Args:
+            offset (int): The index of the first row of the chunk.
+        Returns:
+            List[Dict]: The insertion errors of the chunk, if any.
+        """
+        return list(client.insert_rows_json(table, rows[offset : offset + batch_size]))
 
-    # Check if table exists, if not create it
+    # Insert rows, in chunks sent concurrently
+    offsets = range(0, len(rows), batch_size)
     try:
-        table = client.get_table(table_ref)
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(MAX_INSERT_WORKERS, len(offsets)))
+        ) as executor:
+            chunk_errors = executor.map(insert_chunk, offsets)
+
+            # The row indexes of the errors are relative to their chunk
+            errors: List[Dict] = [
+                (
+                    {**error, "index": error["index"] + offset}
+                    if "index" in error
+                    else error
+                )
+                for offset, chunk in zip(offsets, chunk_errors)
+                for error in chunk
+            ]
     except NotFound:
-        table = bigquery.Table(table_ref, schema=SCHEMA)
-        table = client.create_table(table)
-        print(f"Table {table_id} created in dataset {dataset_id}.")
+        # The cached table was dropped, the next load fetches or creates it again
+        _evict_table(project_id, dataset_id, table_id)
+        raise
 
-    # Insert rows
-    errors = client.insert_rows_json(table, data["extracted_info"])
     if errors:
-        print(f"Errors occurred while inserting rows: {errors}")
+        logger.error(f"Errors occurred while inserting rows: {errors}")
+    else:
+        logger.info(f"Data successfully inserted into {table_id}.")
+
+
+def load_data_to_bigquery_batch(
+    project_id: str, dataset_id: str, table_id: str, data: Dict
+) -> None:
+    """Loads data into a specified BigQuery table with a single load job.
+
+    The rows are serialized as newline-delimited JSON in memory and ingested in
+    one request, appending to the table. The table is created with SCHEMA if it
+    does not exist. Use this function for bulk uploads, and
+    `load_data_to_bigquery` for small payloads that must be queryable right away.
+    Args:
+        project_id (str): The Google Cloud project ID where the BigQuery dataset resides.
+        dataset_id (str): The ID of the BigQuery dataset where the table is located.
+        table_id (str): The ID of the BigQuery table where the data will be loaded.
+        data (Dict): A dictionary containing the data to load into the table.
+                     It is expected to have a key "extracted_info" that holds
+                     a list of dictionaries representing the rows to be loaded.
+    Returns:
+        None: This function does not return a value. It logs messages indicating
+        the success or failure of the load job.
+    """
+    client = bigquery.Client(project=project_id)  # type: ignore
+    table_ref = bigquery.DatasetReference(project_id, dataset_id).table(table_id)
+
+    job_config = bigquery.LoadJobConfig(
+        source_format=bigquery.SourceFormat.NEWLINE_DELIMITED_JSON,
+        schema=SCHEMA,
+        write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+    )
+    payload = io.BytesIO(
+        b"\n".join(json.dumps(row).encode("utf-8") for row in data["extracted_info"])
+    )
+
+    job = client.load_table_from_file(payload, table_ref, job_config=job_config)
+    try:
+        job.result()
+    except GoogleAPICallError:
+        logger.error(f"Errors occurred while loading rows: {job.errors}")
     else:
-        print(f"Data successfully inserted into {table_id}.")
+        logger.info(f"{job.output_rows} rows successfully loaded into {table_id}.")
@@ -0,0 +1,137 @@
+"""
+Cache module to skip the extraction of pdfs that were already processed.
+Users often upload the same pdf again, and every run costs a full LLM call. The results are stored in a local SQLite
+database, keyed by the SHA-256 hash of the pdf content, so identical files are answered without calling the graph.
+it includes:
+1. pdf_cache_key: computes the content hash of a pdf given as a path or as a binary file.
+2. text_cache_key: computes the key of the extraction of an already parsed pdf text, so two different files with the
+same text share the LLM extraction.
+3. class ResultCache: small thread-safe key-value store over SQLite with expiration of the entries.
+4. RESULT_CACHE: the cache instance shared by the workflow runs.
+"""
+
+import hashlib
+import io
+import json
+import sqlite3
+import threading
+import time
+from typing import IO, Dict, Optional, Union
+
+CACHE_PATH = ".extractor_cache.sqlite"
+CACHE_EXPIRE_SECONDS = 7 * 24 * 60 * 60
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def pdf_cache_key(pdf_file: Union[str, IO[bytes]]) -> str:
+    """Computes the cache key of a pdf from its content.
+    Binary files are hashed from their current buffer when possible (no copy for
+    in-memory files) and rewound afterwards, so they can still be read by the graph.
+    Args:
+        pdf_file (Union[str, IO[bytes]]): The file path to the PDF document, or the
+            PDF document as a binary file object.
+    Returns:
+        str: The hexadecimal SHA-256 digest of the pdf content.
+    Raises:
+        OSError: If the pdf can not be read.
+    """
+    if isinstance(pdf_file, str):
+        with open(pdf_file, "rb") as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    pdf_file.seek(0)
+    if isinstance(pdf_file, io.BufferedIOBase):
+        digest = hashlib.file_digest(pdf_file, "sha256").hexdigest()
+    else:
+        # Other binary file objects may lack the readinto used by file_digest.
+        sha256 = hashlib.sha256()
+        for chunk in iter(lambda: pdf_file.read(HASH_CHUNK_SIZE), b""):
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+    pdf_file.seek(0)
+    return digest
+
+
+def text_cache_key(text: str) -> str:
+    """Computes the cache key of the extraction of a pdf text.
+    The keys are prefixed, so they never collide with the keys of whole pdfs.
+    Args:
+        text (str): The text extracted from the pdf.
+    Returns:
+        str: The prefixed hexadecimal SHA-256 digest of the text.
+    """
+    return "text:" + hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ResultCache:
+    """Thread-safe key-value cache of extraction results stored in SQLite.
+
+    The database is only created on the first access, and a single connection is
+    shared between threads behind a lock.
+
+    Attributes:
+        path (str): The path of the SQLite database file.
+        expire (float): The default lifetime of the entries, in seconds.
+    """
+
+    def __init__(self, path: str, expire: float = CACHE_EXPIRE_SECONDS) -> None:
+        """Initializes the cache without touching the disk.
+        Args:
+            path (str): The path of the SQLite database file.
+            expire (float): The default lifetime of the entries, in seconds.
+        """
+        self.path = path
+        self.expire = expire
+        self._connection: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Opens the database and creates the table the first time it is needed.
+        Returns:
+            sqlite3.Connection: The connection shared by the cache.
+        """
+        if self._connection is None:
+            self._connection = sqlite3.connect(self.path, check_same_thread=False)
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+        return self._connection
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Returns the cached value of a key.
+        Args:
+            key (str): The cache key.
+        Returns:
+            Optional[Dict]: The cached value, or None if the key is missing or expired.
+        """
+        with self._lock:
+            row = (
+                self._connect()
+                .execute(
+                    "SELECT value FROM results WHERE key = ? AND expires_at > ?",
+                    (key, time.time()),
+                )
+                .fetchone()
+            )
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Dict, expire: Optional[float] = None) -> None:
+        """Stores the value of a key, replacing any previous one.
+        Args:
+            key (str): The cache key.
+            value (Dict): A JSON serializable value.
+            expire (Optional[float]): The lifetime of the entry in seconds, the cache
+                default is used if None.
+        """
+        expires_at = time.time() + (self.expire if expire is None else expire)
+        with self._lock:
+            connection = self._connect()
+            with connection:
+                connection.execute(
+                    "INSERT OR REPLACE INTO results (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value), expires_at),
+                )
+
+
+RESULT_CACHE = ResultCache(CACHE_PATH)
@@ -0,0 +1,79 @@
+"""
+Checkpoint module to keep the results of a batch when the processing is interrupted.
+Large uploads take a long time, and if the streamlit session dies in the middle every finished pdf would be lost. Each
+successful result is appended to a JSONL file as soon as it completes, keyed by the SHA-256 hash of the pdf content
+(see src/Cache.py), so a new upload of the same batch only processes the pdfs that are missing.
+it includes:
+1. append_result: appends one result as a JSON line, with a single atomic append write.
+2. load_results: returns the results already in the checkpoint file, by key, so skipped pdfs can still be shown.
+3. load_done: returns the keys of the pdfs already in the checkpoint file.
+4. remove_results: deletes the checkpoint file once its batch is complete.
+"""
+
+import json
+import os
+from typing import Dict, Set
+
+CHECKPOINT_PATH = "results.jsonl"
+
+
+def append_result(key: str, result: Dict, path: str = CHECKPOINT_PATH) -> None:
+    """Appends the result of a pdf to the checkpoint file.
+    The line is written with a single write on a file opened in append mode, so
+    concurrent writers never interleave their lines.
+    Args:
+        key (str): The content hash of the pdf.
+        result (Dict): The JSON serializable result of the workflow for the pdf.
+        path (str): The path of the JSONL checkpoint file.
+    """
+    line = json.dumps({"key": key, "result": result}) + "\n"
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+    try:
+        os.write(fd, line.encode("utf-8"))
+    finally:
+        os.close(fd)
+
+
+def load_results(path: str = CHECKPOINT_PATH) -> Dict[str, Dict]:
+    """Reads the results already stored in the checkpoint file.
+    A truncated last line, left by an interrupted write, is ignored. If a pdf was
+    stored more than once, its last result is kept.
+    Args:
+        path (str): The path of the JSONL checkpoint file.
+    Returns:
+        Dict[str, Dict]: The results keyed by the content hash of their pdf, empty if
+            the file does not exist.
+    """
+    results = {}
+    try:
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                    results[record["key"]] = record["result"]
+                except (json.JSONDecodeError, KeyError, TypeError):
+                    continue
+    except FileNotFoundError:
+        pass
+    return results
+
+
+def load_done(path: str = CHECKPOINT_PATH) -> Set[str]:
+    """Reads the keys of the pdfs already stored in the checkpoint file.
+    Args:
+        path (str): The path of the JSONL checkpoint file.
+    Returns:
+        Set[str]: The content hashes of the pdfs with a result, empty if the file does not exist.
+    """
+    return set(load_results(path))
+
+
+def remove_results(path: str = CHECKPOINT_PATH) -> None:
+    """Deletes the checkpoint file, e.g. once every pdf of its batch was processed.
+    Args:
+        path (str): The path of the JSONL checkpoint file. A missing file is ignored.
+    """
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
@@ -2,16 +2,50 @@
 Graph agent system to process the pdf into raw text, maintaining the estructure and
 extracts information in a json format with LLM.
 it includes:
-1. create_extraction_pdf: THis functions takes no input and returns the complete workflow of the Graph
-2. workflow_run: THis function executes the Graph, compiling it and taking the State to be passed by the workflow and
-returns a Dictionary with the results and errors, if any.
+1. process_pdf_node and extract_information_node: the wrappers registered as the nodes of the Graph.
+2. create_extraction_pdf: THis functions takes no input and returns the complete workflow of the Graph
+3. workflow_run: THis function executes the Graph, taking the State to be passed by the workflow and
+returns a Dictionary with the results and errors, if any. The Graph is compiled once, when the module is imported.
+4. workflow_run_async: The asynchronous version of workflow_run, so several Graphs can wait on the LLM at the same time.
+5. workflow_run_batch: Runs workflow_run_async over a list of pdfs with asyncio.gather, keeping a bounded number of
+pdfs in flight so parsing and LLM calls of different pdfs overlap without loading every pdf at once. An optional
+callback receives every result as soon as it completes.
+Successful results are cached by pdf content hash (see src/Cache.py), so a pdf uploaded again skips the graph.
 """
 
-from typing import Dict
+import asyncio
+from typing import Callable, Dict, List, Optional
 
 from langgraph.graph import Graph
 
-from src.LlmModel import State, extract_information, process_pdf
+from src.Cache import RESULT_CACHE, pdf_cache_key
+from src.LlmModel import PdfFile, State, extract_information, process_pdf
+
+
+def process_pdf_node(input: Dict) -> Dict:
+    """Wrapper function for processing PDF files in the graph.
+    This function handles the invocation of the `process_pdf` function and
+    formats the input and output for the graph.
+    Args:
+        input (Dict): A dictionary containing the current state and the PDF file.
+    Returns:
+        Dict: A dictionary containing the updated state after processing the PDF.
+    """
+    state = input["state"]
+    pdf_path = input["pdf_path"]
+    return {"state": process_pdf(state=state, pdf_path=pdf_path)}
+
+
+def extract_information_node(input: Dict) -> Dict:
+    """Wrapper function for extracting information from the state.
+    This function handles the invocation of the `extract_information` function
+    and formats the input and output for the graph.
+    Args:
+        input (Dict): A dictionary containing the current state.
+    Returns:
+        Dict: A dictionary containing the updated state after extracting information.
+    """
+    return {"state": extract_information(input)}
 
 
 def create_extraction_pdf_graph() -> Graph:
@@ -29,30 +63,6 @@ def create_extraction_pdf_graph() -> Graph:
     # Created the graph
     workflow = Graph()
 
-    def process_pdf_node(input: Dict) -> Dict:
-        """Wrapper function for processing PDF files in the graph.
-        This function handles the invocation of the `process_pdf` function and
-        formats the input and output for the graph.
-        Args:
-            input (Dict): A dictionary containing the current state and the PDF path.
-        Returns:
-            Dict: A dictionary containing the updated state after processing the PDF.
-        """
-        state = input["state"]
-        pdf_path = input["pdf_path"]
-        return {"state": process_pdf(state=state, pdf_path=pdf_path)}
-
-    def extract_information_node(input: Dict) -> Dict:
-        """Wrapper function for extracting information from the state.
-        This function handles the invocation of the `extract_information` function
-        and formats the input and output for the graph.
-        Args:
-            input (Dict): A dictionary containing the current state.
-        Returns:
-            Dict: A dictionary containing the updated state after extracting information.
-        """
-        return {"state": extract_information(input)}
-
     # Adding nodes to the graph
     workflow.add_node("process_pdf", process_pdf_node)
     workflow.add_node("extract_information", extract_information_node)
@@ -67,36 +77,159 @@ def create_extraction_pdf_graph() -> Graph:
     return workflow
 
 
-def workflow_run(pdf_path: str) -> Dict:
-    """Executes the PDF extraction workflow and returns the results.
-    This function creates the graph workflow for processing a PDF file, compiles
-    the graph, and executes it with the provided PDF path. It initializes the
-    state and returns the results of the extraction process.
+# The graph is static, so it is compiled once and shared by every run.
+_COMPILED_GRAPH = create_extraction_pdf_graph().compile()
+
+# Maximum number of pdfs processed at the same time by workflow_run_batch.
+MAX_CONCURRENT_PDFS = 8
+
+
+def _initial_input(pdf_path: PdfFile) -> Dict:
+    """Builds the input passed to the graph for a single PDF.
     Args:
-        pdf_path (str): The file path to the PDF document to be processed.
+        pdf_path (PdfFile): The file path or binary file of the PDF document to be processed.
+    Returns:
+        Dict: A dictionary with a fresh State and the PDF file.
+    """
+    return {"state": State(), "pdf_path": pdf_path}
+
+
+def _format_result(output: Dict) -> Dict:
+    """Turns the output of the graph into the result returned to the caller.
+    Args:
+        output (Dict): The dictionary returned by the compiled graph.
     Returns:
         Dict: A dictionary containing the status of the operation and either the
             extracted information or an error message if an error occurred.
     """
+    result = output["state"]
+    if result.error:
+        return {"status": "error", "error": result.error}
 
-    # Creates the graph
-    workflow = create_extraction_pdf_graph()
+    # The entry is dumped to plain JSON types here, so the result can be cached, checkpointed and loaded to BigQuery.
+    return {
+        "status": "success",
+        "extracted_info": result.extracted_info.model_dump(mode="json"),
+    }
 
-    # Compiles it
-    compiled_graph = workflow.compile(
-        debug=True
-    )  # used to check the process in the notebook. It is also useful with docker and streamlit
 
-    # Initialization of the State class
-    initial_state = State(pdf_text="", extracted_info=None, error=None)
-    config = {"state": initial_state, "pdf_path": pdf_path}
+def _cache_key(pdf_path: PdfFile) -> Optional[str]:
+    """Computes the cache key of a PDF, if it can be read.
+    Unreadable PDFs are not cached: the graph will report the error itself.
+    Args:
+        pdf_path (PdfFile): The file path or binary file of the PDF document to be processed.
+    Returns:
+        Optional[str]: The content hash of the PDF, or None if it can not be read.
+    """
+    try:
+        return pdf_cache_key(pdf_path)
+    except OSError:
+        return None
 
-    # Executing the graph Pipeline
-    result = compiled_graph.invoke(input=config)
-    result = result["state"]
 
-    # Returning possible results.
-    if result["error"]:
-        return {"status": "error", "error": result["error"]}
+def _store_result(key: Optional[str], result: Dict) -> None:
+    """Caches a workflow result. Only successful extractions are stored.
+    Args:
+        key (Optional[str]): The cache key of the PDF, None to skip the cache.
+        result (Dict): The result returned by the workflow.
+    """
+    if key is not None and result["status"] == "success":
+        RESULT_CACHE.set(key, result)
+
+
+def workflow_run(pdf_path: PdfFile) -> Dict:
+    """Executes the PDF extraction workflow and returns the results.
+    This function executes the compiled graph workflow with the provided PDF file.
+    It initializes the state and returns the results of the extraction process.
+    If the same PDF content was already extracted, the cached result is returned
+    without running the graph.
+    Args:
+        pdf_path (PdfFile): The file path or binary file of the PDF document to be processed.
+    Returns:
+        Dict: A dictionary containing the status of the operation and either the
+            extracted information or an error message if an error occurred.
+    """
+    key = _cache_key(pdf_path)
+    cached = RESULT_CACHE.get(key) if key is not None else None
+    if cached is not None:
+        return cached
+
+    # Executing the graph Pipeline
+    result = _format_result(_COMPILED_GRAPH.invoke(input=_initial_input(pdf_path)))
+    _store_result(key, result)
+    return result
+
+
+async def workflow_run_async(pdf_path: PdfFile, key: Optional[str] = None) -> Dict:
+    """Asynchronous version of `workflow_run`.
+    The graph is awaited with `ainvoke`, so the event loop can keep other
+    workflows running while this one waits for the LLM response. The PDF is hashed
+    in a worker thread, unless its cache key was already computed by the caller, and
+    the result cache is read and written in worker threads too, so its SQLite calls
+    never block the other workflows of the event loop.
+    Args:
+        pdf_path (PdfFile): The file path or binary file of the PDF document to be processed.
+        key (Optional[str]): The cache key of the PDF, as computed by `pdf_cache_key`.
+    Returns:
+        Dict: A dictionary containing the status of the operation and either the
+            extracted information or an error message if an error occurred.
+    """
+    if key is None:
+        key = await asyncio.to_thread(_cache_key, pdf_path)
+    cached = None
+    if key is not None:
+        cached = await asyncio.to_thread(RESULT_CACHE.get, key)
+    if cached is not None:
+        return cached
+
+    output = await _COMPILED_GRAPH.ainvoke(input=_initial_input(pdf_path))
+    result = _format_result(output)
+    await asyncio.to_thread(_store_result, key, result)
+    return result
+
+
+async def workflow_run_batch(
+    pdf_files: List[PdfFile],
+    max_concurrency: int = MAX_CONCURRENT_PDFS,
+    on_result: Optional[Callable[[int, Dict], None]] = None,
+    keys: Optional[List[str]] = None,
+) -> List[Dict]:
+    """Executes the PDF extraction workflow for several PDFs concurrently.
+    The graph nodes run in the event loop executor, so while one PDF waits for the
+    LLM the next ones are already being parsed. A semaphore caps the number of PDFs
+    in flight, which bounds the memory held by extracted texts on large uploads.
+    Args:
+        pdf_files (List[PdfFile]): The file paths or binary files of the PDF documents to be processed.
+        max_concurrency (int): The maximum number of PDFs processed at the same time.
+        on_result (Optional[Callable[[int, Dict], None]]): Called with the position of
+            each PDF in `pdf_files` and its result as soon as it completes, e.g. to
+            checkpoint the results before the whole batch is done.
+        keys (Optional[List[str]]): The cache keys of the PDFs, in the same order as
+            `pdf_files`, when the caller already computed them.
+    Returns:
+        List[Dict]: One result per PDF, in the same order as `pdf_files`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrency)
 
-    return {"status": "success", "extracted_info": result["extracted_info"]}
+    async def bounded_run(position: int, pdf_path: PdfFile) -> Dict:
+        """Runs the workflow for one PDF once a slot is available.
+        Args:
+            position (int): The position of the PDF in `pdf_files`.
+            pdf_path (PdfFile): The file path or binary file of the PDF document to be processed.
+        Returns:
+            Dict: The result of `workflow_run_async` for the PDF.
+        """
+        async with semaphore:
+            result = await workflow_run_async(
+                pdf_path, keys[position] if keys is not None else None
+            )
+        if on_result is not None:
+            on_result(position, result)
+        return result
+
+    return await asyncio.gather(
+        *(
+            bounded_run(position, pdf_path)
+            for position, pdf_path in enumerate(pdf_files)
+        )
+    )
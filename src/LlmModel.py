@@ -3,31 +3,376 @@ LLM model file
 
 In this module, we defined the LLM system.
 This module includes:
-1. class State: a TypedDict which allow us to control the workflow with an estructure.
-2. Function process_pdf: a function that takes as input tje State and a pdf path and returns the update State with the clean raw text.
-3. Function extract_information: THe function takes the updated State class from process_pdf. It creates the chain call
- to the llm and returns the updated State with the llm powered information extraction.
+1. class State: a slotted dataclass which allow us to control the workflow with an estructure.
+2. Function process_pdf: a function that takes as input tje State and a pdf (a path or an in-memory binary file) and returns
+the update State with the clean raw text. The text is extracted with PDFium when the optional pypdfium2 package is
+installed, which is several times faster than the pure python pypdf used otherwise. The pages of large pdfs are split
+among a pool of worker processes.
+3. Function process_pdfs: the batch version of process_pdf for a list of pdf paths, with one whole pdf per worker of
+a multiprocessing pool.
+4. Functions split_text_into_chunks and merge_entries: split the text of very large pdfs in chunks extracted
+separately, and merge the entries of the chunks back into one.
+5. Function extract_information_batch: extracts the information of several texts with a single llm call. It is used by
+the BatchingExtractor when EXTRACTION_BATCH_SIZE is greater than 1.
+6. Function extract_information: THe function takes the updated State class from process_pdf. It creates the chain call
+ to the llm and returns the updated State with the llm powered information extraction. The llm is constrained with
+ OpenAI structured outputs (a strict JSON schema of BigQueryEntry), so its answer is always parseable JSON, which is
+ parsed and validated into a BigQueryEntry in a single pass. Only the answers over the list or document_id limits, which
+ strict outputs can not enforce, are decoded again, truncated and sanitized, with a warning in the logs.
 """
 
 # Imports
-from typing import Dict, Optional, TypedDict
+import io
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import (
+    IO,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Type,
+    TypeVar,
+    Union,
+)
 
-from langchain_community.document_loaders import PyPDFLoader
-from langchain_core.output_parsers import JsonOutputParser
+import openai
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.runnables import Runnable, RunnableLambda
 from langchain_openai import ChatOpenAI
+from pydantic import BaseModel, SecretStr, ValidationError
+from pypdf import PdfReader
 
-from src.PydanticSchema import BigQueryEntry
+try:  # Optional, much faster backend for the text extraction, installed with the "pdfium" extra
+    import pypdfium2 as pdfium  # type: ignore[import-untyped]
+except ImportError:
+    pdfium = None
+
+from src.BatchExtractor import BatchingExtractor
+from src.Cache import RESULT_CACHE, text_cache_key
+from src.PydanticSchema import BigQueryEntry, BigQueryEntryBatch
+
+logger = logging.getLogger(__name__)
+
+# A PDF can be given as a file path or as an already opened binary file, like the ones uploaded with streamlit.
+PdfFile = Union[str, IO[bytes]]
+
+# Page level parallelism of the text extraction. Neither PDFium nor pypdf extract pages in parallel threads (PDFium is
+# not thread-safe and pypdf holds the GIL), so the pages of large pdfs are split among worker processes. The workers
+# reopen the pdf from its path, so uploaded files are first written to a temporary directory shared by the process.
+# The gains flatten out after ~4 workers, and below ~20 pages the cost of dispatching the ranges outweighs them.
+PAGE_WORKERS = min(4, os.cpu_count() or 1)
+PARALLEL_MIN_PAGES = 21
+_PAGE_POOL: Optional[ProcessPoolExecutor] = None
+_PAGE_POOL_LOCK = threading.Lock()
+# PDFium can not be called from two threads at the same time, not even for different documents, and the graph runs
+# several pdfs in its executor threads. Every in-process PDFium call is made while holding this lock.
+_PDFIUM_LOCK = threading.Lock()
+_SPILL_DIR: Optional[tempfile.TemporaryDirectory] = None
+SPILL_CHUNK_SIZE = 64 * 1024
+
+# Micro-batching of the llm calls. It is disabled with the default size of 1, as every pdf gets its own call.
+EXTRACTION_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "1"))
+EXTRACTION_BATCH_WAIT_MS = float(os.getenv("EXTRACTION_BATCH_WAIT_MS", "200"))
+
+# Texts longer than EXTRACTION_CHUNK_TOKENS are split in chunks extracted by concurrent llm calls, whose entries are
+# merged, so very large pdfs neither exceed the context window nor wait for one huge call. The tokens are estimated
+# from the characters, at about CHARS_PER_TOKEN characters per token for English text.
+EXTRACTION_CHUNK_TOKENS = int(os.getenv("EXTRACTION_CHUNK_TOKENS", "25000"))
+CHARS_PER_TOKEN = 4
+CHUNK_CONCURRENCY = 8
+
+# Texts with fewer than MIN_TEXT_CHARS non blank characters, like the ones of scanned pdfs without a text layer, can
+# not hold the fields of an entry, so they fail fast instead of paying for an llm call.
+MIN_TEXT_CHARS = int(os.getenv("MIN_TEXT_CHARS", "20"))
+# The maximum number of items of the list fields, merged across the chunks.
+_LIST_MAX_ITEMS = {
+    name: field["maxItems"]
+    for name, field in BigQueryEntry.model_json_schema()["properties"].items()
+    if "maxItems" in field
+}
+# The characters a document_id can not hold, replaced in the answers of the llm.
+_INVALID_ID_CHARS = re.compile(r"[^a-zA-Z0-9_-]")
+# The pydantic model an answer of the llm is validated into.
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# The llm answers with structured outputs, so its JSON always follows the schema of the entries and needs no format
+# instructions in the prompt. The chatgpt-4o-latest alias does not support them, hence the pinned gpt-4o family.
+EXTRACTION_MODEL = "gpt-4o"
+
+
+def _entry_schema() -> Dict:
+    """Builds the JSON schema of the fields the LLM has to fill for one document.
+    The processed_timestamp is left out, as it is set when the entry is validated,
+    and so are the docstring and the examples of the model, to save prompt tokens.
+    The maximum number of items of the lists is left out too, as strict structured
+    outputs do not support it, the descriptions of the fields state every limit instead.
+    Returns:
+        Dict: A strict JSON schema of a BigQueryEntry.
+    """
+    properties = BigQueryEntry.model_json_schema()["properties"]
+    properties.pop("processed_timestamp")
+    # Strict structured outputs reject the list bounds, they are enforced by pydantic when the answer is parsed.
+    for field in properties.values():
+        field.pop("maxItems", None)
+    return {
+        "type": "object",
+        "properties": properties,
+        "required": list(properties),
+        "additionalProperties": False,
+    }
+
+
+ENTRY_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {"name": "BigQueryEntry", "strict": True, "schema": _entry_schema()},
+}
+BATCH_RESPONSE_FORMAT = {
+    "type": "json_schema",
+    "json_schema": {
+        "name": "BigQueryEntryBatch",
+        "strict": True,
+        "schema": {
+            "type": "object",
+            "properties": {"entries": {"type": "array", "items": _entry_schema()}},
+            "required": ["entries"],
+            "additionalProperties": False,
+        },
+    },
+}
+
+# Opt-in cache of identical llm calls (same model, response format and prompt) in a local SQLite database, installed by
+# enable_llm_cache. It is off by default, as it keeps the full pdf texts of the prompts without expiration, and the
+# extractions are already cached by the hash of their text.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "0") == "1"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".langchain_cache.db")
+
+# Transient OpenAI failures (rate limits, connection errors, 5xx) are retried with exponential backoff and jitter, and
+# the number of requests in flight is capped, so a large upload degrades to waiting instead of failing pdfs.
+RETRYABLE_ERRORS = (
+    openai.RateLimitError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+)
+LLM_MAX_ATTEMPTS = 6
+OPENAI_CONCURRENCY = int(os.getenv("OPENAI_CONCURRENCY", "16"))
+_LLM_SLOTS = threading.BoundedSemaphore(OPENAI_CONCURRENCY)
+
+SYSTEM_PROMPT = """You are an expert at extracting structured information from documents.
+                    Extract the requested information from the text and format it according to the specified schema.
+                    Be precise and factual in your extraction."""
+# The variable parts go at the end of the prompts, so every call shares the same static prefix (system prompt and
+# instructions) and OpenAI can serve it from its prompt cache instead of processing it again.
+USER_PROMPT = "Extract the following information from this text: {text}"
+BATCH_USER_PROMPT = (
+    "Extract the following information from each of these documents. "
+    "Return exactly one entry per document, in the same order.\n\n{documents}\n\n"
+    "There are {count} documents."
+)
+
+
+def _extraction_llm(response_format: Dict, api_key: Optional[str]) -> Runnable:
+    """Creates the extraction LLM, constrained to a response format and retried on transient errors.
+    The retries of the OpenAI client are disabled, so the backoff is only applied once.
+    Args:
+        response_format (Dict): The structured outputs format the LLM must answer with.
+        api_key (Optional[str]): The OpenAI API key, read from the environment by the client if None.
+    Returns:
+        Runnable: The LLM runnable to use in the extraction chains.
+    """
+    return (
+        ChatOpenAI(
+            model=EXTRACTION_MODEL,
+            temperature=0,
+            max_retries=0,
+            api_key=SecretStr(api_key) if api_key else None,
+        )
+        .bind(response_format=response_format)
+        .with_retry(
+            retry_if_exception_type=RETRYABLE_ERRORS,
+            wait_exponential_jitter=True,
+            stop_after_attempt=LLM_MAX_ATTEMPTS,
+        )
+    )
+
+
+def _message_text(message: BaseMessage) -> str:
+    """Returns the text of a message, joining its parts when the content is a list.
+    Args:
+        message (BaseMessage): The message returned by the LLM.
+    Returns:
+        str: The text content of the message.
+    """
+    content = message.content
+    if isinstance(content, str):
+        return content
+    return "".join(
+        part if isinstance(part, str) else part.get("text", "") for part in content
+    )
+
+
+def _fit_limits(data: Any) -> bool:
+    """Fits the entries of a decoded answer to the limits strict outputs can not enforce.
+    The lists longer than their maximum number of items are truncated, as merge_entries
+    does, and the characters a document_id does not allow (like the ":" and "." of
+    "arXiv:2501.00663v1") are replaced by underscores. The entries are changed in place.
+    Args:
+        data (Any): The decoded JSON answer, of one entry or of a batch of entries.
+    Returns:
+        bool: True if any entry was changed.
+    """
+    entries = data.get("entries") if isinstance(data, dict) else None
+    changed = False
+    for entry in entries if isinstance(entries, list) else [data]:
+        if not isinstance(entry, dict):
+            continue
+        for name, max_items in _LIST_MAX_ITEMS.items():
+            items = entry.get(name)
+            if isinstance(items, list) and len(items) > max_items:
+                entry[name] = items[:max_items]
+                changed = True
+        document_id = entry.get("document_id")
+        if isinstance(document_id, str) and _INVALID_ID_CHARS.search(document_id):
+            entry["document_id"] = _INVALID_ID_CHARS.sub("_", document_id)
+            changed = True
+    return changed
+
+
+def _validate_answer(model: Type[ModelT], message: BaseMessage) -> ModelT:
+    """Parses and validates the answer of the LLM in a single pass with pydantic.
+    Only when that fails, the answer is decoded again and fitted to the limits the LLM
+    can not be constrained to (see _fit_limits). The repair is logged as a warning and
+    the repaired answer is validated again, any other invalid answer is rejected.
+    Args:
+        model (Type[ModelT]): The pydantic model of the answer.
+        message (BaseMessage): The message returned by the LLM.
+    Returns:
+        ModelT: The validated answer.
+    Raises:
+        ValidationError: If the answer is not valid, even after fitting it to the limits.
+    """
+    content = _message_text(message)
+    try:
+        return model.model_validate_json(content)
+    except ValidationError as error:
+        try:
+            data = json.loads(content)
+        except ValueError:
+            raise error from None
+        if not _fit_limits(data):
+            raise
+        logger.warning(
+            "The LLM answer exceeded the list or document_id limits of the entries, "
+            "it was truncated and sanitized: %s",
+            error,
+        )
+        return model.model_validate(data)
+
+
+def _parse_entry(message: BaseMessage) -> BigQueryEntry:
+    """Parses and validates the answer of the LLM for one document.
+    Args:
+        message (BaseMessage): The message returned by the LLM.
+    Returns:
+        BigQueryEntry: The validated entry.
+    Raises:
+        ValidationError: If the answer is not a valid BigQueryEntry.
+    """
+    return _validate_answer(BigQueryEntry, message)
+
+
+def _parse_batch(message: BaseMessage) -> List[BigQueryEntry]:
+    """Parses and validates the answer of the LLM for a batch of documents.
+    Args:
+        message (BaseMessage): The message returned by the LLM.
+    Returns:
+        List[BigQueryEntry]: The validated entries, in the order of the documents.
+    Raises:
+        ValidationError: If the answer is not a valid BigQueryEntryBatch.
+    """
+    return _validate_answer(BigQueryEntryBatch, message).entries
+
+
+@lru_cache(maxsize=4)
+def _get_chain(batch: bool, api_key: Optional[str]) -> Runnable:
+    """Builds an extraction chain once per process instead of once per document.
+    The LLM client keeps the API key it was created with, so the key is part of the
+    cache key and a new key gets its own chain.
+    Args:
+        batch (bool): Whether the chain extracts several documents in one LLM call.
+        api_key (Optional[str]): The OpenAI API key of the LLM client.
+    Returns:
+        Runnable: The chain of prompt, LLM and pydantic parser.
+    """
+    parser: Callable[[BaseMessage], Any]
+    if batch:
+        llm = _extraction_llm(BATCH_RESPONSE_FORMAT, api_key)
+        user_prompt, parser = BATCH_USER_PROMPT, _parse_batch
+    else:
+        llm = _extraction_llm(ENTRY_RESPONSE_FORMAT, api_key)
+        user_prompt, parser = USER_PROMPT, _parse_entry
+
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", SYSTEM_PROMPT), ("user", user_prompt)]
+    )
+
+    # Chain to be processed
+    return prompt | llm | RunnableLambda(parser)
+
+
+def enable_llm_cache(path: str = LLM_CACHE_PATH) -> None:
+    """Installs the SQLite cache of the llm calls for the whole process.
+    Calling it again with the same path keeps the cache already installed.
+    Args:
+        path (str): The path of the SQLite database of the cache.
+    """
+    from langchain_community.cache import SQLiteCache
+    from langchain_core.globals import get_llm_cache, set_llm_cache
+
+    cache = get_llm_cache()
+    if not (isinstance(cache, SQLiteCache) and cache.engine.url.database == path):
+        set_llm_cache(SQLiteCache(database_path=path))
+
+
+def clear_llm_clients() -> None:
+    """Drops the cached extraction chains, and with them the API keys of their LLM clients."""
+    _get_chain.cache_clear()
+
+
+def _run_chain(chain: Runnable, input: Dict) -> Any:
+    """Invokes an extraction chain while holding one of the OPENAI_CONCURRENCY request slots.
+    Args:
+        chain (Runnable): The extraction chain.
+        input (Dict): The variables of the prompt.
+    Returns:
+        Any: The output of the chain.
+    """
+    with _LLM_SLOTS:
+        return chain.invoke(input)
 
 
 # First is to define the state of the graph, which is going to take the actions performed into its object
-class State(TypedDict):
+@dataclass(slots=True)
+class State:
     """Represents the state of a graph traversal.
 
-    This TypedDict is used to manage the flow of the graph by storing relevant
+    This slotted dataclass is used to manage the flow of the graph by storing relevant
     information about the current state, including the text extracted from a PDF,
     any information extracted for BigQueryEntry pydantic format, and any errors encountered during
-    processing.
+    processing. The slots give the nodes direct attribute access and no per instance dictionary.
 
     Attributes:
         pdf_text (str): The text extracted from the PDF document.
@@ -37,39 +382,343 @@ class State(TypedDict):
             or None if no errors were encountered.
     """
 
-    pdf_text: str
-    extracted_info: Optional[BigQueryEntry]
-    error: Optional[str]
+    pdf_text: str = ""
+    extracted_info: Optional[BigQueryEntry] = None
+    error: Optional[str] = None
+
+    def __getitem__(self, key: str) -> Any:
+        """Reads a field with the item access of the former TypedDict state.
+        Args:
+            key (str): The name of the field.
+        Returns:
+            Any: The value of the field.
+        Raises:
+            KeyError: If the state has no such field.
+        """
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def __setitem__(self, key: str, value: Any) -> None:
+        """Writes a field with the item access of the former TypedDict state.
+        Args:
+            key (str): The name of the field.
+            value (Any): The new value of the field.
+        Raises:
+            KeyError: If the state has no such field.
+        """
+        if key not in self.__slots__:
+            raise KeyError(key)
+        setattr(self, key, value)
+
+
+def _page_count(pdf_file: PdfFile) -> int:
+    """Counts the pages of a PDF.
+    Args:
+        pdf_file (PdfFile): The file path to the PDF document, or the PDF document
+            as a binary file object.
+    Returns:
+        int: The number of pages of the document.
+    """
+    if pdfium is not None:
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_file)
+            try:
+                return len(pdf)
+            finally:
+                pdf.close()
+    return len(PdfReader(pdf_file).pages)
+
+
+def _iter_page_texts(pdf_file: PdfFile, start: int, stop: int) -> Iterator[str]:
+    """Yields the text of the pages in [start, stop) of a PDF, one page at a time.
+    Args:
+        pdf_file (PdfFile): The file path to the PDF document, or the PDF document
+            as a binary file object.
+        start (int): The index of the first page to extract.
+        stop (int): The index after the last page to extract.
+    Yields:
+        str: The text of every page of the range, in order.
+    """
+    if pdfium is not None:
+        # The lock is released between the pages, so the threads of other pdfs can
+        # extract theirs while this page is consumed.
+        with _PDFIUM_LOCK:
+            pdf = pdfium.PdfDocument(pdf_file)
+        try:
+            for index in range(start, stop):
+                with _PDFIUM_LOCK:
+                    page = pdf[index]
+                    textpage = page.get_textpage()
+                    text = textpage.get_text_range()
+                    textpage.close()
+                    page.close()
+                yield text
+        finally:
+            with _PDFIUM_LOCK:
+                pdf.close()
+        return
+
+    reader = PdfReader(pdf_file)
+    for index in range(start, stop):
+        yield reader.pages[index].extract_text()
+
+
+def _extract_page_range(pdf_file: PdfFile, start: int, stop: int) -> List[str]:
+    """Extracts the text of the pages in [start, stop) of a PDF.
+    It opens the document itself, so it can run in a worker process with only the
+    path of the PDF.
+    Args:
+        pdf_file (PdfFile): The file path to the PDF document, or the PDF document
+            as a binary file object.
+        start (int): The index of the first page to extract.
+        stop (int): The index after the last page to extract.
+    Returns:
+        List[str]: The text of every page of the range, in order.
+    """
+    return list(_iter_page_texts(pdf_file, start, stop))
+
+
+def _join_pages(page_texts: Iterable[str]) -> str:
+    """Joins the text of the pages with new lines, as they are produced.
+    Every page is written to the buffer and released before the next one is read,
+    instead of keeping the texts of all the pages next to the joined text.
+    Args:
+        page_texts (Iterable[str]): The text of the pages, in order.
+    Returns:
+        str: The text of the pages, separated by new lines.
+    """
+    buffer = io.StringIO()
+    for index, text in enumerate(page_texts):
+        if index:
+            buffer.write("\n")
+        buffer.write(text)
+    return buffer.getvalue()
+
+
+def _page_pool() -> ProcessPoolExecutor:
+    """Returns the process pool shared by the page extractions, creating it on the first use.
+    The workers are spawned rather than forked, as the graph runs its nodes in threads.
+    Returns:
+        ProcessPoolExecutor: The pool of PAGE_WORKERS processes.
+    """
+    global _PAGE_POOL
+    with _PAGE_POOL_LOCK:
+        if _PAGE_POOL is None:
+            _PAGE_POOL = ProcessPoolExecutor(
+                max_workers=PAGE_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+    return _PAGE_POOL
 
 
-def process_pdf(state: State, pdf_path: str) -> State:
+def _spill_dir() -> str:
+    """Returns the temporary directory shared by the uploaded files sent to the page workers.
+    It is created on the first use and removed with all its files when the process exits.
+    Returns:
+        str: The path of the directory.
+    """
+    global _SPILL_DIR
+    with _PAGE_POOL_LOCK:
+        if _SPILL_DIR is None:
+            _SPILL_DIR = tempfile.TemporaryDirectory(prefix="pdf-extractor-")
+    return _SPILL_DIR.name
+
+
+def _extract_pages_parallel(pdf_path: str, page_count: int) -> str:
+    """Extracts the text of a PDF with one page range per worker of the process pool.
+    Args:
+        pdf_path (str): The file path to the PDF document.
+        page_count (int): The number of pages of the document.
+    Returns:
+        str: The text of the pages, separated by new lines.
+    """
+    step = -(-page_count // PAGE_WORKERS)
+    starts = range(0, page_count, step)
+    stops = [min(start + step, page_count) for start in starts]
+    ranges = _page_pool().map(
+        _extract_page_range, [pdf_path] * len(starts), starts, stops
+    )
+    return _join_pages(text for pages in ranges for text in pages)
+
+
+def _extract_text(pdf_file: PdfFile, parallel_pages: bool = True) -> str:
+    """Extracts the text of every page of a PDF.
+    Documents with at least PARALLEL_MIN_PAGES pages are split in one page range per
+    worker and extracted in the process pool. Smaller ones are extracted in place.
+    Args:
+        pdf_file (PdfFile): The file path to the PDF document, or the PDF document
+            as a binary file object.
+        parallel_pages (bool): Whether large documents may use the page process pool.
+    Returns:
+        str: The text of the pages, separated by new lines.
+    """
+    page_count = _page_count(pdf_file)
+    if not parallel_pages or PAGE_WORKERS < 2 or page_count < PARALLEL_MIN_PAGES:
+        if not isinstance(pdf_file, str):
+            pdf_file.seek(0)
+        return _join_pages(_iter_page_texts(pdf_file, 0, page_count))
+
+    if isinstance(pdf_file, str):
+        return _extract_pages_parallel(pdf_file, page_count)
+
+    # Binary files are streamed once to the shared directory, so the workers read the
+    # same file instead of each receiving a pickled copy of the pdf.
+    fd, pdf_path = tempfile.mkstemp(suffix=".pdf", dir=_spill_dir())
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pdf_file.seek(0)
+            shutil.copyfileobj(pdf_file, f, length=SPILL_CHUNK_SIZE)
+        return _extract_pages_parallel(pdf_path, page_count)
+    finally:
+        os.remove(pdf_path)
+
+
+def process_pdf(state: State, pdf_path: PdfFile, parallel_pages: bool = True) -> State:
     """Processes a PDF file and updates the state with the extracted text.
 
-    This function takes a `State` dictionary and a file path to a PDF document,
-    loads the PDF, extracts its text, and updates the state with the extracted
-    text. If an error occurs during processing, the state is updated with an
-    error message.
+    This function takes a `State` dictionary and a PDF document, given either as a
+    file path or as a binary file object, loads the PDF, extracts its text, and
+    updates the state with the extracted text. Binary file objects are read in
+    memory, so uploaded files do not need to be written to disk first. PDFium is
+    used when pypdfium2 is installed, pypdf otherwise, and the pages of large
+    documents are extracted in parallel worker processes. If an error occurs
+    during processing, the state is updated with an error message.
 
     Args:
         state (State): A dictionary representing the current state of the graph,
             which will be updated with the extracted PDF text or an error message.
-        pdf_path (str): The file path to the PDF document to be processed.
+        pdf_path (PdfFile): The file path to the PDF document, or the PDF document
+            as a binary file object.
+        parallel_pages (bool): Whether the pages of large documents may be extracted
+            in the page process pool. Disabled when the caller is already a worker.
 
     Returns:
         State: The updated state dictionary containing the extracted PDF text or
             an error message if an error occurred during processing.
     """
     try:
-        loader = PyPDFLoader(file_path=pdf_path)
-        docs = loader.load()
-        text = "\n".join(page.page_content for page in docs)
-        state["pdf_text"] = text
+        state.pdf_text = _extract_text(pdf_path, parallel_pages=parallel_pages)
         return state
     except Exception as e:
-        state["error"] = f"Error processing the PDF: {str(e)}"
+        state.error = f"Error processing the PDF: {str(e)}"
         return state
 
 
+def _single_pdf_worker(pdf_path: str) -> State:
+    """Processes one PDF in a worker process of process_pdfs.
+    The pages are extracted in place, as the pool workers can not start processes.
+    Args:
+        pdf_path (str): The file path to the PDF document.
+    Returns:
+        State: A new state with the extracted PDF text or an error message.
+    """
+    state = State()
+    return process_pdf(state, pdf_path, parallel_pages=False)
+
+
+def process_pdfs(pdf_paths: List[str]) -> List[State]:
+    """Processes several PDF files in parallel, one whole PDF per worker process.
+
+    The parsing of the PDFs is CPU bound, so a pool of processes extracts several
+    documents at the same time without sharing the GIL. The number of workers is
+    read from the LOAD_PDF_WORKERS environment variable, and defaults to all the
+    cores but one.
+
+    Args:
+        pdf_paths (List[str]): The file paths to the PDF documents.
+
+    Returns:
+        List[State]: One state per PDF, in the same order as `pdf_paths`, with the
+            extracted text or an error message.
+    """
+    workers = int(os.environ.get("LOAD_PDF_WORKERS", max(1, (os.cpu_count() or 1) - 1)))
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        return pool.map(_single_pdf_worker, pdf_paths)
+
+
+def split_text_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """Splits a text in chunks of whole words with at most `max_tokens` tokens each.
+    The tokens are estimated as CHARS_PER_TOKEN characters each, which avoids
+    tokenizing the whole text. The length of the current chunk is tracked while the
+    words are added, so the text is only joined once per chunk. A single word longer
+    than the limit gets a chunk of its own.
+    Args:
+        text (str): The text to split.
+        max_tokens (int): The maximum number of tokens of a chunk.
+    Returns:
+        List[str]: The chunks, in the order of the text.
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    chunks = []
+    current_chunk: List[str] = []
+    current_len = 0
+    for word in text.split():
+        # The words of a chunk are joined with one space
+        added_len = len(word) + (1 if current_chunk else 0)
+        if current_chunk and current_len + added_len > max_chars:
+            chunks.append(" ".join(current_chunk))
+            current_chunk, current_len = [], 0
+            added_len = len(word)
+        current_chunk.append(word)
+        current_len += added_len
+    if current_chunk:
+        chunks.append(" ".join(current_chunk))
+    return chunks
+
+
+def merge_entries(entries: List[BigQueryEntry]) -> BigQueryEntry:
+    """Merges the entries extracted from the chunks of one document.
+    The single valued fields (ids, title, date, summary and methodology) are taken
+    from the first chunk, where the front matter of a document is. The lists are
+    the union of the lists of every chunk, without duplicates and in order of
+    appearance, cut to the maximum number of items of the field.
+    Args:
+        entries (List[BigQueryEntry]): The entries of the chunks, in the order of the text.
+    Returns:
+        BigQueryEntry: The entry of the whole document.
+    """
+    merged = {}
+    for name, max_items in _LIST_MAX_ITEMS.items():
+        items = dict.fromkeys(
+            item for entry in entries for item in getattr(entry, name)
+        )
+        merged[name] = list(items)[:max_items]
+    return entries[0].model_copy(update=merged)
+
+
+def extract_information_batch(texts: List[str]) -> List[BigQueryEntry]:
+    """Extracts structured information from several texts with a single LLM call.
+
+    The texts are sent as numbered sections of one prompt, so the system prompt is
+    only paid once, and the LLM answers with one entry per text.
+
+    Args:
+        texts (List[str]): The texts extracted from the PDF documents.
+
+    Returns:
+        List[BigQueryEntry]: The extracted information of every text, in the same order.
+    """
+    chain = _get_chain(True, os.getenv("OPENAI_API_KEY"))
+
+    documents = "\n\n".join(
+        f"### DOC {number}\n{text}" for number, text in enumerate(texts, start=1)
+    )
+    return _run_chain(chain, {"count": len(texts), "documents": documents})
+
+
+# Shared by every graph run, so the pdfs processed at the same time end up in the same batch.
+_BATCHER = (
+    BatchingExtractor(
+        extract_information_batch,
+        batch_size=EXTRACTION_BATCH_SIZE,
+        max_wait_ms=EXTRACTION_BATCH_WAIT_MS,
+    )
+    if EXTRACTION_BATCH_SIZE > 1
+    else None
+)
+
+
 def extract_information(config: Dict) -> State:
     """Extracts structured information from the PDF text in the state.
 
@@ -78,6 +727,11 @@ def extract_information(config: Dict) -> State:
     state. If an error is present in the state, it returns the state without making
     any changes. If the extraction is successful, the state is updated with the
     extracted information The information is structured using pydantic model schema.
+    Texts longer than EXTRACTION_CHUNK_TOKENS are split in chunks, extracted with
+    concurrent LLM calls, and their entries merged. The extractions are cached by
+    the hash of the text, so a text seen before skips the LLM entirely. Texts
+    shorter than MIN_TEXT_CHARS, e.g. from scanned pdfs, set an error without
+    calling the LLM.
 
     Args:
         config (Dict): A configuration dictionary that must contain a "state" key,
@@ -88,42 +742,43 @@ def extract_information(config: Dict) -> State:
             or an error message if an error occurred during the extraction process.
     """
     state = config["state"]
-    if "error" in state and state["error"]:
+    if state.error:
+        return state
+    if len(state.pdf_text.strip()) < MIN_TEXT_CHARS:
+        state.error = "Error extracting information: the PDF text is empty or too short"
         return state
     try:
-        llm = ChatOpenAI(model="chatgpt-4o-latest", temperature=0)
+        # The same text was already extracted, e.g. from another file or a previous run
+        key = text_cache_key(state.pdf_text)
+        cached = RESULT_CACHE.get(key)
+        if cached is not None:
+            state.extracted_info = BigQueryEntry.model_validate(cached)
+            return state
 
-        parser = JsonOutputParser(pydantic_object=BigQueryEntry)
+        chunks = split_text_into_chunks(state.pdf_text, EXTRACTION_CHUNK_TOKENS)
+        if _BATCHER is not None and len(chunks) <= 1:
+            # The text travels to the llm together with the ones of other pdfs
+            result = _BATCHER.submit(state.pdf_text).result()
+            state.extracted_info = result
+            RESULT_CACHE.set(key, result.model_dump(mode="json"))
+            return state
 
-        prompt = ChatPromptTemplate.from_messages(
-            [
-                (
-                    "system",
-                    """You are an expert at extracting structured information from documents.
-                    Extract the requested information from the text and format it according to the specified schema.
-                    Be precise and factual in your extraction.""",
-                ),
-                (
-                    "user",
-                    "Extract the following information from this text: {text}\n\n{format_instructions}",
-                ),
-            ]
-        )
-
-        # Chain to be processed
-        chain = prompt | llm | parser
+        chain = _get_chain(False, os.getenv("OPENAI_API_KEY"))
 
         # Running the chain
-        result = chain.invoke(
-            {
-                "text": state["pdf_text"],
-                "format_instructions": parser.get_format_instructions(),
-            }
-        )
+        if len(chunks) <= 1:
+            result = _run_chain(chain, {"text": state.pdf_text})
+        else:
+            # The chunks are extracted concurrently, each call holding its own request slot
+            run_chunk = RunnableLambda(lambda text: _run_chain(chain, {"text": text}))
+            result = merge_entries(
+                run_chunk.batch(chunks, config={"max_concurrency": CHUNK_CONCURRENCY})
+            )
 
-        state["extracted_info"] = result
+        state.extracted_info = result
+        RESULT_CACHE.set(key, result.model_dump(mode="json"))
         return state
 
     except Exception as e:
-        state["error"] = f"Error extracting information: {str(e)}"
+        state.error = f"Error extracting information: {str(e)}"
         return state
@@ -4,12 +4,14 @@ This includes:
 5. custom validation functions: THis functions ensures that, if we send the structured info to BigQuery, those entries will conform with the expected format estructure.
 4. type definitions: Using annotated, we created specific variable types that will be helpful when checking the format of the information extracted by the LLM.
 3. class BigQueryEntry: THis Pydantic BaseModel is the base to estructure the output of the LLM call. It contains all the necessary fields and the basic schema example for the llm call.
-4. class PDFValidator: small utility class that only checks that the streamlit app is receiving the correct input.
+4. class BigQueryEntryBatch: wrapper of several BigQueryEntry, used to validate the answer of the LLM when it extracts a batch of documents in one call.
+5. class PDFValidator: small utility class that only checks that the streamlit app is receiving the correct input.
 """
 
 # LINE 193: #We need to come back here and changed to V2 VALIDATOR USE
 import re
-from datetime import datetime, timezone
+import time
+from datetime import date, datetime, timezone
 from typing import Annotated, Callable, List
 
 from pydantic import (  # ValidationInfo We need to use this one for the @field_validation functions.
@@ -21,6 +23,11 @@ from pydantic.functional_validators import (  # Dataclass that allow us to perfo
     AfterValidator,
 )
 
+# Compiled once, fullmatch also rejects a trailing new line that "$" would let through.
+_DOCUMENT_ID_PATTERN = re.compile(r"[a-zA-Z0-9_-]+")
+# Last second formatted by processed_timestamp, with its ISO 8601 string.
+_timestamp_cache = (-1, "")
+
 
 def validate_non_empty_string(v: str) -> str:
     """Validates that the provided string is not empty.
@@ -66,40 +73,57 @@ def validate_string_length(max_length: int) -> Callable[[str], str]:
     return validate
 
 
-def validate_list_length(max_items: int) -> Callable[[List[str]], List[str]]:
-    """Creates a validation function to check the length of a list.
-    This function returns a validation function that checks if a given list
-    does not exceed the specified maximum number of items. If the list exceeds
-    the maximum number of items, a ValueError is raised.
+def validate_bounded_string(max_length: int) -> Callable[[str], str]:
+    """Creates a single validation function for non-empty strings with a maximum length.
+    It fuses validate_non_empty_string and validate_string_length, so every string
+    field costs one Python call instead of two chained validators.
     Args:
-        max_items (int): The maximum allowed number of items in the list.
+        max_length (int): The maximum allowed length for the trimmed string.
     Returns:
-        Callable[[List[str]], List[str]]: A validation function that checks
-        the length of a list of strings.
+        Callable[[str], str]: A validation function that trims the string and checks
+        that it is neither empty nor longer than `max_length`.
     """
 
-    def validate(v: List[str]) -> List[str]:
-        """Validates that the list does not exceed the maximum number of items.
+    def validate(v: str) -> str:
+        """Validates that the trimmed string is not empty and does not exceed the maximum length.
         Args:
-            v (List[str]): The list to validate.
+            v (str): The string to validate.
         Returns:
-            List[str]: The validated list if it does not exceed the maximum
-            number of items.
+            str: The trimmed string.
         Raises:
-            ValueError: If the list exceeds the maximum number of items.
+            ValueError: If the string is empty or exceeds the maximum length.
         """
-        if len(v) > max_items:
-            raise ValueError(f"List must not exceed {max_items} items")
+        v = v.strip()
+        if not v:
+            raise ValueError("String must not be empty")
+        if len(v) > max_length:
+            raise ValueError(f"String must not exceed {max_length} characters")
         return v
 
     return validate
 
 
+def processed_timestamp() -> str:
+    """Returns the current UTC time in ISO 8601 format, with a resolution of one second.
+    The formatted string is reused for every entry created within the same second,
+    so the entries of a batch do not format the time again each.
+    Returns:
+        str: The ISO 8601 timestamp of the current second.
+    """
+    global _timestamp_cache
+    second = int(time.time())
+    cached_second, timestamp = _timestamp_cache
+    if second != cached_second:
+        timestamp = datetime.fromtimestamp(second, timezone.utc).isoformat()
+        _timestamp_cache = (second, timestamp)
+    return timestamp
+
+
 # Type definitions using Annotated
 NonEmptyString = Annotated[str, AfterValidator(validate_non_empty_string)]
-ShortString = Annotated[NonEmptyString, AfterValidator(validate_string_length(256))]
-LongString = Annotated[NonEmptyString, AfterValidator(validate_string_length(1024))]
-VeryLongString = Annotated[NonEmptyString, AfterValidator(validate_string_length(4096))]
+ShortString = Annotated[str, AfterValidator(validate_bounded_string(256))]
+LongString = Annotated[str, AfterValidator(validate_bounded_string(1024))]
+VeryLongString = Annotated[str, AfterValidator(validate_bounded_string(4096))]
 
 
 class BigQueryEntry(BaseModel):
@@ -140,11 +164,16 @@ class BigQueryEntry(BaseModel):
 
     document_id: Annotated[
         str,
-        Field(description="Unique identifier for the document"),
+        Field(
+            description="Unique identifier for the document, of at most 1024 characters, "
+            "using only letters, numbers, hyphens and underscores"
+        ),
         AfterValidator(validate_string_length(1024)),
     ]
 
-    title: LongString = Field(description="The title of the document")
+    title: LongString = Field(
+        description="The title of the document, of at most 1024 characters"
+    )
 
     publication_date: Annotated[
         str,
@@ -155,31 +184,40 @@ class BigQueryEntry(BaseModel):
 
     authors: Annotated[
         List[ShortString],
-        Field(description="List of authors of the document"),
-        AfterValidator(validate_list_length(100)),
+        Field(
+            description="List of authors of the document, at most 100 names "
+            "of up to 256 characters each",
+            max_length=100,
+        ),
     ]
 
     key_words: Annotated[
         List[ShortString],
-        Field(description="The summary keywords of the document"),
-        AfterValidator(validate_list_length(50)),
+        Field(
+            description="The summary keywords of the document, at most 50 keywords "
+            "of up to 256 characters each",
+            max_length=50,
+        ),
     ]
 
     key_points: Annotated[
         List[LongString],
-        Field(description="Main points or findings from the document"),
-        AfterValidator(validate_list_length(50)),
+        Field(
+            description="Main points or findings from the document, at most 50 points "
+            "of up to 1024 characters each",
+            max_length=50,
+        ),
     ]
 
-    summary: VeryLongString = Field(description="A brief summary of the document")
+    summary: VeryLongString = Field(
+        description="A brief summary of the document, of at most 4096 characters"
+    )
 
     methodology: VeryLongString = Field(
-        description="A brief summary of the methodology used in the article."
+        description="A brief summary of the methodology used in the article, of at most 4096 characters."
     )
 
-    processed_timestamp: str = Field(
-        default_factory=lambda: datetime.now(timezone.utc).isoformat()
-    )
+    processed_timestamp: str = Field(default_factory=processed_timestamp)
 
     @field_validator("publication_date")
     def validate_date(cls, v):
@@ -192,8 +230,12 @@ class BigQueryEntry(BaseModel):
         Raises:
             ValueError: If the date is not in YYYY-MM-DD format.
         """
+        # fromisoformat is much faster than strptime, but it also accepts other ISO
+        # forms (like 20240121), hence the check of the length and the separators.
         try:
-            datetime.strptime(v, "%Y-%m-%d")
+            if len(v) != 10 or v[4] != "-" or v[7] != "-":
+                raise ValueError
+            date.fromisoformat(v)
             return v
         except ValueError:
             raise ValueError("Date must be in YYYY-MM-DD format")
@@ -209,7 +251,7 @@ class BigQueryEntry(BaseModel):
         Raises:
             ValueError: If the document ID contains invalid characters.
         """
-        if not re.match(r"^[a-zA-Z0-9_-]+$", v):
+        if not _DOCUMENT_ID_PATTERN.fullmatch(v):
             raise ValueError(
                 "document_id must contain only letters, numbers, hyphens, and underscores"
             )
@@ -234,6 +276,17 @@ class BigQueryEntry(BaseModel):
     }
 
 
+class BigQueryEntryBatch(BaseModel):
+    """Pydantic model representing the extraction of several documents in one LLM call.
+
+    Attributes:
+        entries (List[BigQueryEntry]): One entry per document, in the same order as
+            the documents were given to the LLM.
+    """
+
+    entries: List[BigQueryEntry]
+
+
 class PDFValidator(BaseModel):
     """Validation model for PDF file inputs in the application.
 
@@ -243,7 +296,7 @@ class PDFValidator(BaseModel):
 
     Attributes:
         file_name (str): The name of the file to validate, which must end with
-            the '.pdf' extension.
+            the '.pdf' extension, in any case.
 
     Validators:
         validate_pdf: Ensures that the file name ends with '.pdf'.
@@ -263,8 +316,23 @@ class PDFValidator(BaseModel):
             str: The validated file name.
 
         Raises:
-            ValueError: If the file name does not end with '.pdf'.
+            ValueError: If the file name does not end with '.pdf', in any case.
         """
-        if not file_name.endswith(".pdf"):
+        if not PDFValidator.is_pdf(file_name):
             raise ValueError("File must be a PDF.")
         return file_name
+
+    @staticmethod
+    def is_pdf(file_name: str) -> bool:
+        """Checks the extension of a file name without building a pydantic model.
+
+        It is meant for scanning many uploads at once, the model is kept for the
+        final validation.
+
+        Args:
+            file_name (str): The name of the file to check.
+
+        Returns:
+            bool: True if the file name ends with '.pdf', in any case.
+        """
+        return file_name.lower().endswith(".pdf")
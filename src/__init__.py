@@ -1,5 +1,6 @@
 """ initializer for the main.py main program with streamlit"""
 
-from .BigQueryLoader import load_data_to_bigquery
-from .GraphModel import workflow_run
+from .BigQueryLoader import load_data_to_bigquery, load_data_to_bigquery_batch
+from .GraphModel import workflow_run, workflow_run_batch
+from .LlmModel import LLM_CACHE_ENABLED, clear_llm_clients, enable_llm_cache
 from .PydanticSchema import PDFValidator
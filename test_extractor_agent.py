@@ -1,175 +1,807 @@
 """File module to test all the functions for our app"""
 
+import asyncio
+import io
+import json
+import logging
+import math
+import os
+import tempfile
+import threading
+import time
 import unittest
-from datetime import datetime
-from unittest.mock import MagicMock, patch
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from types import MappingProxyType, SimpleNamespace
+from unittest.mock import DEFAULT, MagicMock, patch
 
 from google.api_core.exceptions import NotFound
 from google.cloud import bigquery
-
-from src.BigQueryLoader import load_data_to_bigquery
-from src.LlmModel import extract_information, process_pdf
-from src.PydanticSchema import BigQueryEntry
+from google.cloud.bigquery import Client, Table
+from langchain_core.globals import get_llm_cache, set_llm_cache
+from langchain_core.messages import AIMessage
+from pydantic import ValidationError
+from pypdf import PdfReader, PdfWriter
+
+from src import LlmModel
+from src.BatchExtractor import BatchingExtractor
+from src.BigQueryLoader import (
+    _TABLE_CACHE,
+    _TABLE_CACHE_LOCK,
+    load_data_to_bigquery,
+    load_data_to_bigquery_batch,
+)
+from src.Cache import ResultCache, pdf_cache_key
+from src.Checkpoint import append_result, load_done, load_results, remove_results
+from src.GraphModel import workflow_run_batch
+from src.LlmModel import (
+    RETRYABLE_ERRORS,
+    State,
+    _parse_batch,
+    _parse_entry,
+    clear_llm_clients,
+    enable_llm_cache,
+    extract_information,
+    merge_entries,
+    process_pdf,
+    process_pdfs,
+    split_text_into_chunks,
+)
+from src.PydanticSchema import (
+    BigQueryEntry,
+    PDFValidator,
+    validate_bounded_string,
+    validate_non_empty_string,
+    validate_string_length,
+)
+
+# Boundary values of the BigQueryEntry limits, built once for the whole module
+_STR_256, _STR_257 = "x" * 256, "x" * 257
+_STR_1024, _STR_1025 = "x" * 1024, "x" * 1025
+_AUTHORS_100 = ["Author"] * 100
+_AUTHORS_101 = _AUTHORS_100 + ["Author"]
+_POINTS_50 = ["Point"] * 50
+_POINTS_51 = _POINTS_50 + ["Point"]
 
 
 class TestLlmModelFunctions(unittest.TestCase):
     """Tests for the LLM model file functions."""
 
-    def setUp(self):
-        """Set up test data that will be used across multiple tests"""
-        self.valid_state = {
-            "pdf_text": "",
-            "extracted_info": None,
-            "error": None,
-        }
-
-        self.valid_doc_data = {
-            "document_id": "doc_2024_001",
-            "title": "Example Document",
-            "publication_date": "2024-01-21",
-            "authors": ["John Doe", "Jane Smith"],
-            "key_words": ["key1", "key2"],
-            "key_points": ["First main point", "Second main point"],
-            "summary": "A brief summary of the document content",
-            "methodology": "a brief description of tte methodology used",
-            "processed_timestamp": "2024-01-21T10:00:00.000Z",
-        }
+    @classmethod
+    def setUpClass(cls):
+        """Set up the read-only test data shared by all the tests"""
+        cls.valid_doc_data = MappingProxyType(
+            {
+                "document_id": "doc_2024_001",
+                "title": "Example Document",
+                "publication_date": "2024-01-21",
+                "authors": ["John Doe", "Jane Smith"],
+                "key_words": ["key1", "key2"],
+                "key_points": ["First main point", "Second main point"],
+                "summary": "A brief summary of the document content",
+                "methodology": "a brief description of tte methodology used",
+                "processed_timestamp": "2024-01-21T10:00:00.000Z",
+            }
+        )
 
-    @patch("src.LlmModel.PyPDFLoader")
-    def test_process_pdf_valid(self, mock_loader):
+    def setUp(self):
+        """Set up the state and the cache, which the tests modify"""
+        clear_llm_clients()
+        temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(temp_dir.cleanup)
+        cache = ResultCache(os.path.join(temp_dir.name, "cache.sqlite"))
+        cache_patcher = patch("src.LlmModel.RESULT_CACHE", cache)
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        self.valid_state = State()
+
+    @patch("src.LlmModel.pdfium", None)
+    @patch("src.LlmModel.PdfReader")
+    def test_process_pdf_valid(self, mock_reader):
         """Test processing a valid PDF"""
         mock_path = "sample.pdf"
         mock_text = "This is a test document."
 
-        # Mock the PyPDFLoader
-        mock_loader_instance = MagicMock()
-        mock_loader.return_value = mock_loader_instance
-        mock_loader_instance.load.return_value = [MagicMock(page_content=mock_text)]
+        # Mock the PdfReader
+        mock_reader_instance = MagicMock(spec_set=PdfReader)
+        mock_reader.return_value = mock_reader_instance
+        mock_reader_instance.pages = [SimpleNamespace(extract_text=lambda: mock_text)]
 
         # Act
         result_state = process_pdf(self.valid_state, mock_path)
 
         # Assert
-        self.assertEqual(result_state["pdf_text"], mock_text)
-        self.assertIsNone(result_state["error"], "Error should be None for valid PDF")
+        self.assertEqual(result_state.pdf_text, mock_text)
+        self.assertIsNone(result_state.error, "Error should be None for valid PDF")
 
-    @patch("src.LlmModel.PyPDFLoader")
-    def test_process_pdf_invalid(self, mock_loader):
+    @patch("src.LlmModel.pdfium", None)
+    @patch("src.LlmModel.PdfReader")
+    def test_process_pdf_invalid(self, mock_reader):
         """Test processing an invalid PDF"""
-        mock_loader.side_effect = Exception("File not found")
+        mock_reader.side_effect = Exception("File not found")
         mock_path = "nonexistent.pdf"
 
         # Act
         result_state = process_pdf(self.valid_state, mock_path)
 
         # Assert
-        self.assertIn("Error processing the pdf", result_state["error"])
+        self.assertIn("Error processing the PDF", result_state.error)
+
+    def _blank_pdf(self):
+        """Build an in-memory PDF with two blank pages"""
+        buffer = io.BytesIO()
+        writer = PdfWriter()
+        writer.add_blank_page(width=72, height=72)
+        writer.add_blank_page(width=72, height=72)
+        writer.write(buffer)
+        buffer.seek(0)
+        return buffer
+
+    @patch("src.LlmModel.pdfium", None)
+    def test_process_pdf_in_memory(self):
+        """Test processing a PDF given as an in-memory binary file"""
+        # Act
+        result_state = process_pdf(self.valid_state, self._blank_pdf())
 
-    @patch("src.LlmModel.ChatOpenAI")
-    @patch("src.LlmModel.JsonOutputParser")
-    @patch("src.LlmModel.ChatPromptTemplate")
-    def test_extract_information_valid(
-        self, mock_prompt_template, mock_parser, mock_llm
-    ):
+        # Assert
+        self.assertIsNone(result_state.error, "Error should be None for valid PDF")
+        self.assertEqual(result_state.pdf_text, "\n")
+
+    @patch("src.LlmModel.PARALLEL_MIN_PAGES", 2)
+    @patch("src.LlmModel.PAGE_WORKERS", 2)
+    def test_process_pdf_parallel_pages(self):
+        """Test that large PDFs are split in page ranges extracted by the worker processes"""
+        buffer = self._blank_pdf()
+
+        # Act
+        with patch("src.LlmModel._page_pool") as mock_pool:
+            mock_pool.return_value.map.side_effect = lambda fn, *args: map(fn, *args)
+            result_state = process_pdf(self.valid_state, buffer)
+
+        # Assert
+        self.assertIsNone(result_state.error, "Error should be None for valid PDF")
+        self.assertEqual(result_state.pdf_text, "\n")
+        fn, paths, starts, stops = mock_pool.return_value.map.call_args.args
+        self.assertEqual(len(set(paths)), 1, "Workers should share one spilled file")
+        self.assertFalse(os.path.exists(paths[0]), "Spilled file should be removed")
+        self.assertEqual((list(starts), stops), ([0, 1], [1, 2]))
+
+    @patch.dict(os.environ, {"LOAD_PDF_WORKERS": "2"})
+    def test_process_pdfs(self):
+        """Test that a batch of PDF paths is processed in order by the worker pool"""
+        with tempfile.TemporaryDirectory() as temp_dir:
+            pdf_path = os.path.join(temp_dir, "blank.pdf")
+            with open(pdf_path, "wb") as f:
+                f.write(self._blank_pdf().getvalue())
+            missing_path = os.path.join(temp_dir, "missing.pdf")
+
+            # Act
+            states = process_pdfs([pdf_path, missing_path])
+
+        # Assert
+        self.assertEqual(states[0].pdf_text, "\n")
+        self.assertIsNone(states[0].error)
+        self.assertIn("Error processing the PDF", states[1].error)
+
+    @unittest.skipIf(LlmModel.pdfium is None, "pypdfium2 is not installed")
+    def test_process_pdf_in_memory_pdfium(self):
+        """Test processing an in-memory PDF with the PDFium backend"""
+        # Act
+        result_state = process_pdf(self.valid_state, self._blank_pdf())
+
+        # Assert
+        self.assertIsNone(result_state.error, "Error should be None for valid PDF")
+        self.assertEqual(result_state.pdf_text, "\n")
+
+    @unittest.skipIf(LlmModel.pdfium is None, "pypdfium2 is not installed")
+    def test_process_pdf_pdfium_threads(self):
+        """Test that PDFium is never called from two threads at the same time"""
+        buffers = [self._blank_pdf() for _ in range(8)]
+        lock = LlmModel._PDFIUM_LOCK
+        real_document = LlmModel.pdfium.PdfDocument
+
+        def document(*args, **kwargs):
+            self.assertTrue(lock.locked(), "PdfDocument opened without the lock")
+            return real_document(*args, **kwargs)
+
+        # Act
+        with patch.object(LlmModel.pdfium, "PdfDocument", side_effect=document):
+            with ThreadPoolExecutor(max_workers=8) as executor:
+                states = list(
+                    executor.map(lambda buffer: process_pdf(State(), buffer), buffers)
+                )
+
+        # Assert
+        for state in states:
+            self.assertIsNone(state.error)
+            self.assertEqual(state.pdf_text, "\n")
+
+    def test_extract_information_valid(self):
         """Test extracting information from a valid state"""
         valid_text = "This is a valid document text."
-        self.valid_state["pdf_text"] = valid_text
+        self.valid_state.pdf_text = valid_text
+        entry = BigQueryEntry(**self.valid_doc_data)
+
+        # Mock the LLM and the PromptTemplate only while the chain is built and run
+        with patch.multiple(
+            "src.LlmModel", ChatOpenAI=DEFAULT, ChatPromptTemplate=DEFAULT
+        ) as mocks:
+            mock_llm = mocks["ChatOpenAI"]
+            mock_llm_instance = mock_llm.return_value
+            mock_prompt_instance = mocks[
+                "ChatPromptTemplate"
+            ].from_messages.return_value
+            mock_chain = mock_prompt_instance.__or__.return_value.__or__.return_value
+            mock_chain.invoke.return_value = entry
+
+            # Act
+            result_state = extract_information({"state": self.valid_state})
+
+        # Assert
+        self.assertEqual(result_state.extracted_info, entry)
+        self.assertIsNone(
+            result_state.error, "Error should be None for valid extraction"
+        )
+        mock_chain.invoke.assert_called_once_with({"text": valid_text})
 
-        # Mock LLM, Parser, and PromptTemplate
-        mock_llm_instance = MagicMock()
-        mock_llm.return_value = mock_llm_instance
-        mock_llm_instance.invoke.return_value = self.valid_doc_data
+        # The llm is constrained with the strict JSON schema of the entries
+        response_format = mock_llm_instance.bind.call_args.kwargs["response_format"]
+        schema = response_format["json_schema"]["schema"]
+        self.assertEqual(response_format["type"], "json_schema")
+        self.assertNotIn("processed_timestamp", schema["properties"])
+        self.assertEqual(set(schema["required"]), set(schema["properties"]))
 
-        mock_parser_instance = MagicMock()
-        mock_parser.return_value = mock_parser_instance
-        mock_parser_instance.get_format_instructions.return_value = (
-            "format instructions"
+        # Transient OpenAI errors are retried by the chain, not by the client
+        self.assertEqual(mock_llm.call_args.kwargs["max_retries"], 0)
+        retry_kwargs = mock_llm_instance.bind.return_value.with_retry.call_args.kwargs
+        self.assertEqual(retry_kwargs["retry_if_exception_type"], RETRYABLE_ERRORS)
+
+    @patch("src.LlmModel.ChatPromptTemplate")
+    @patch("src.LlmModel.ChatOpenAI")
+    def test_extraction_chain_reused(self, mock_llm, mock_prompt_template):
+        """Test that the chain is built once per API key and not once per document"""
+        texts = [
+            "First document text.",
+            "Second document text.",
+            "Third document text.",
+        ]
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "key_1"}):
+            extract_information({"state": State(pdf_text=texts[0])})
+            extract_information({"state": State(pdf_text=texts[1])})
+        self.assertEqual(mock_llm.call_count, 1)
+
+        with patch.dict(os.environ, {"OPENAI_API_KEY": "key_2"}):
+            extract_information({"state": State(pdf_text=texts[2])})
+        self.assertEqual(
+            mock_llm.call_args.kwargs["api_key"].get_secret_value(), "key_2"
         )
-        mock_parser_instance.parse.return_value = self.valid_doc_data
 
-        mock_prompt_instance = MagicMock()
-        mock_prompt_template.from_messages.return_value = mock_prompt_instance
-        mock_prompt_instance.invoke.return_value = self.valid_doc_data
+    @patch("src.LlmModel._get_chain")
+    def test_extract_information_short_text(self, mock_get_chain):
+        """Test that an empty or too short text fails without calling the LLM"""
+        for text in ["", "\n \n", "Page 1"]:
+            with self.subTest(text=text):
+                result_state = extract_information({"state": State(pdf_text=text)})
+                self.assertIn("too short", result_state.error)
+                self.assertIsNone(result_state.extracted_info)
+        mock_get_chain.assert_not_called()
+
+    def test_enable_llm_cache(self):
+        """Test that the llm cache is only installed on demand, in the given file"""
+        self.assertIsNone(get_llm_cache(), "Importing the module must not set a cache")
+        self.addCleanup(set_llm_cache, None)
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = os.path.join(temp_dir, "llm_cache.db")
+
+            enable_llm_cache(path)
+            cache = get_llm_cache()
+            enable_llm_cache(path)
+
+            self.assertEqual(cache.engine.url.database, path)
+            self.assertIs(get_llm_cache(), cache)
+            cache.engine.dispose()
+
+    @patch("src.LlmModel._get_chain")
+    def test_extract_information_cached_text(self, mock_get_chain):
+        """Test that a text extracted before skips the LLM"""
+        entry = BigQueryEntry(**self.valid_doc_data)
+        mock_get_chain.return_value.invoke.return_value = entry
 
         # Act
-        result_state = extract_information(self.valid_state)
+        for _ in range(2):
+            state = State(pdf_text="The same document text.")
+            result_state = extract_information({"state": state})
 
         # Assert
-        self.assertEqual(result_state["extracted_info"], self.valid_doc_data)
-        self.assertIsNone(
-            result_state["error"], "Error should be None for valid extraction"
-        )
+        self.assertEqual(result_state.extracted_info, entry)
+        mock_get_chain.return_value.invoke.assert_called_once()
 
     @patch("src.LlmModel.ChatOpenAI")
     def test_extract_information_error(self, mock_llm):
         """Test extracting information when LLM raises an error"""
         valid_text = "This is a valid document text."
-        self.valid_state["pdf_text"] = valid_text
+        self.valid_state.pdf_text = valid_text
 
         # Mock LLM to raise an exception
         mock_llm.side_effect = Exception("LLM Error")
 
         # Act
-        result_state = extract_information(self.valid_state)
+        result_state = extract_information({"state": self.valid_state})
+
+        # Assert
+        self.assertIn("Error extracting information", result_state.error)
+
+    def test_state_item_access(self):
+        """Test that the state fields can still be read and written as items"""
+        self.valid_state["pdf_text"] = "text"
+
+        self.assertEqual(self.valid_state.pdf_text, "text")
+        self.assertIsNone(self.valid_state["extracted_info"])
+        with self.assertRaises(KeyError):
+            self.valid_state["unknown"]
+
+    def test_parse_entry(self):
+        """Test that the LLM answer is parsed into a validated BigQueryEntry"""
+        entry = _parse_entry(AIMessage(content=json.dumps(dict(self.valid_doc_data))))
+        self.assertIsInstance(entry, BigQueryEntry)
+        self.assertEqual(entry.document_id, self.valid_doc_data["document_id"])
+
+        invalid_data = {**self.valid_doc_data, "publication_date": "21/01/2024"}
+        with self.assertRaisesRegex(ValidationError, "Date must be in YYYY-MM-DD"):
+            _parse_entry(AIMessage(content=json.dumps(invalid_data)))
+
+    def test_parse_entry_fits_limits(self):
+        """Test that only the answers over the list and document_id limits are repaired, with a warning"""
+        with self.assertNoLogs("src.LlmModel", level="WARNING"):
+            _parse_entry(AIMessage(content=json.dumps(dict(self.valid_doc_data))))
+
+        data = {
+            **self.valid_doc_data,
+            "document_id": "arXiv:2501.00663v1",
+            "key_words": [f"key{i}" for i in range(80)],
+        }
+
+        with self.assertLogs("src.LlmModel", level="WARNING") as logs:
+            entry = _parse_entry(
+                AIMessage(content=[{"type": "text", "text": json.dumps(data)}])
+            )
+            (batch_entry,) = _parse_batch(
+                AIMessage(content=json.dumps({"entries": [data]}))
+            )
+
+        self.assertEqual(len(logs.records), 2)
+        self.assertEqual(entry.document_id, "arXiv_2501_00663v1")
+        self.assertEqual(entry.key_words, data["key_words"][:50])
+        self.assertEqual(batch_entry.document_id, entry.document_id)
+        self.assertEqual(batch_entry.key_words, entry.key_words)
+
+        # Other invalid fields are still rejected, even along a repairable one
+        invalid_data = {**data, "publication_date": "21/01/2024"}
+        with self.assertRaisesRegex(ValidationError, "Date must be in YYYY-MM-DD"):
+            _parse_entry(AIMessage(content=json.dumps(invalid_data)))
+
+    def test_split_text_into_chunks(self):
+        """Test that chunks keep whole words within the maximum length"""
+        text = "alpha beta gamma delta epsilon"
+
+        chunks = split_text_into_chunks(text, max_tokens=3)
+
+        self.assertEqual(chunks, ["alpha beta", "gamma delta", "epsilon"])
+        self.assertEqual(split_text_into_chunks(text, max_tokens=100), [text])
+        self.assertEqual(split_text_into_chunks("", max_tokens=10), [])
+
+    def test_merge_entries(self):
+        """Test that the chunk entries are merged into one entry"""
+        first = BigQueryEntry(**self.valid_doc_data)
+        second = first.model_copy(
+            update={"title": "Other title", "authors": ["Jane Smith", "Max Mustermann"]}
+        )
+
+        merged = merge_entries([first, second])
+
+        self.assertEqual(merged.title, first.title)
+        self.assertEqual(merged.authors, ["John Doe", "Jane Smith", "Max Mustermann"])
+
+    @patch("src.LlmModel.EXTRACTION_CHUNK_TOKENS", 3)
+    @patch("src.LlmModel._get_chain")
+    def test_extract_information_chunks(self, mock_get_chain):
+        """Test that long texts are extracted by chunks and merged"""
+        entry = BigQueryEntry(**self.valid_doc_data)
+        mock_get_chain.return_value.invoke.side_effect = lambda input: (
+            entry.model_copy(update={"key_words": [input["text"]]})
+        )
+        self.valid_state.pdf_text = "first chunk second chunk"
+
+        # Act
+        result_state = extract_information({"state": self.valid_state})
 
         # Assert
-        self.assertIn("Error Extracting information", result_state["error"])
+        self.assertIsNone(result_state.error)
+        self.assertEqual(
+            result_state.extracted_info.key_words, ["first chunk", "second chunk"]
+        )
+
+    def test_pdf_validator(self):
+        """Test that the PDF extension check is case insensitive"""
+        self.assertTrue(PDFValidator.is_pdf("report.PDF"))
+        self.assertFalse(PDFValidator.is_pdf("report.pdf.txt"))
+        self.assertEqual(PDFValidator(file_name="report.Pdf").file_name, "report.Pdf")
+        with self.assertRaisesRegex(ValidationError, "File must be a PDF"):
+            PDFValidator(file_name="report.docx")
+
+    def _assert_entry_roundtrip(self, data):
+        """Validate a document and check that every field keeps its value"""
+        doc = BigQueryEntry.model_validate(data)
+        for field, value in data.items():
+            self.assertEqual(getattr(doc, field), value, field)
+
+        # The full ISO parsing is checked once, in test_timestamp_iso_roundtrip
+        timestamp = doc.processed_timestamp
+        self.assertTrue(
+            len(timestamp) >= 19 and timestamp[4] == "-" and timestamp[10] in "T ",
+            "processed_timestamp is not in ISO format",
+        )
 
-    # Additional validation and BigQueryEntry tests remain unchanged
     def test_valid_document_creation(self):
-        """Test creation of a valid BigQueryEntry instance"""
-        doc = BigQueryEntry(**self.valid_doc_data)
-        self.assertEqual(doc.document_id, self.valid_doc_data["document_id"])
-        self.assertEqual(doc.title, self.valid_doc_data["title"])
-        self.assertEqual(doc.date, self.valid_doc_data["date"])
-        self.assertEqual(doc.authors, self.valid_doc_data["authors"])
-        self.assertEqual(doc.key_points, self.valid_doc_data["key_points"])
-        self.assertEqual(doc.summary, self.valid_doc_data["summary"])
-
-        # Verify processed_timestamp is in ISO format
+        """Test creation of valid BigQueryEntry instances"""
+        documents = [
+            self.valid_doc_data,
+            BigQueryEntry.model_config["json_schema_extra"]["examples"][0],
+        ]
+        for position, data in enumerate(documents):
+            with self.subTest(document=position):
+                self._assert_entry_roundtrip(data)
+
+    def test_timestamp_iso_roundtrip(self):
+        """Test that the generated processed_timestamp is a UTC ISO 8601 timestamp"""
+        data = {**self.valid_doc_data}
+        del data["processed_timestamp"]
+
+        doc = BigQueryEntry.model_validate(data)
+
         try:
-            datetime.fromisoformat(doc.processed_timestamp)
+            timestamp = datetime.fromisoformat(doc.processed_timestamp)
         except ValueError:
             self.fail("processed_timestamp is not in valid ISO format")
+        self.assertEqual(timestamp.utcoffset(), timedelta(0))
+        self.assertEqual(timestamp.isoformat(), doc.processed_timestamp)
+
+    def test_string_validators(self):
+        """Test the error messages of the string validation functions"""
+        self.assertEqual(validate_non_empty_string("  text "), "text")
+        with self.assertRaisesRegex(ValueError, "String must not be empty"):
+            validate_non_empty_string("   ")
+
+        self.assertEqual(validate_string_length(4)("text"), "text")
+        with self.assertRaisesRegex(ValueError, "String must not exceed 4 characters"):
+            validate_string_length(4)("texts")
+
+        self.assertEqual(validate_bounded_string(4)(" text "), "text")
+        with self.assertRaisesRegex(ValueError, "String must not be empty"):
+            validate_bounded_string(4)(" ")
+        with self.assertRaisesRegex(ValueError, "String must not exceed 4 characters"):
+            validate_bounded_string(4)("texts")
+
+    def test_invalid_document_id(self):
+        """Test that document IDs with invalid characters are rejected"""
+        for document_id in ["doc 2024", "doc#2024", "doc_2024\n", ""]:
+            with self.subTest(document_id=document_id):
+                with self.assertRaisesRegex(
+                    ValidationError, "document_id must contain only"
+                ):
+                    BigQueryEntry.model_validate(
+                        {**self.valid_doc_data, "document_id": document_id}
+                    )
+
+    def test_invalid_date_format(self):
+        """Test that publication dates not in YYYY-MM-DD format are rejected"""
+        for publication_date in ["21/01/2024", "20240121", "2024-1-21", "2024-02-30"]:
+            with self.subTest(publication_date=publication_date):
+                with self.assertRaisesRegex(
+                    ValidationError, "Date must be in YYYY-MM-DD format"
+                ):
+                    BigQueryEntry.model_validate(
+                        {**self.valid_doc_data, "publication_date": publication_date}
+                    )
+
+    def test_length_boundaries(self):
+        """Test the maximum length of the string fields and the size of the lists"""
+        cases = [
+            ("title", _STR_1024, None),
+            ("title", _STR_1025, "String must not exceed 1024 characters"),
+            ("authors", [_STR_256], None),
+            ("authors", [_STR_257], "String must not exceed 256 characters"),
+            ("authors", _AUTHORS_100, None),
+            ("authors", _AUTHORS_101, "List should have at most 100 items"),
+            ("key_points", _POINTS_50, None),
+            ("key_points", _POINTS_51, "List should have at most 50 items"),
+        ]
+        for field, value, error in cases:
+            with self.subTest(field=field, size=len(value), error=error):
+                data = {**self.valid_doc_data, field: value}
+                if error is None:
+                    doc = BigQueryEntry.model_validate(data)
+                    self.assertEqual(getattr(doc, field), value)
+                else:
+                    with self.assertRaisesRegex(ValidationError, error):
+                        BigQueryEntry.model_validate(data)
+
+
+class TestGraphModelFunctions(unittest.TestCase):
+    """Tests for the Graph model file functions."""
+
+    @patch("src.GraphModel.extract_information")
+    @patch("src.GraphModel.process_pdf")
+    def test_workflow_run_batch_bounded(self, mock_process_pdf, mock_extract):
+        """Test that the batch keeps the input order and runs exactly up to the concurrency limit"""
+        in_flight = []
+        max_in_flight = []
+        lock = threading.Lock()
+
+        def process(state, pdf_path):
+            with lock:
+                in_flight.append(pdf_path)
+                max_in_flight.append(len(in_flight))
+            time.sleep(0.05)
+            state.pdf_text = pdf_path
+            return state
+
+        def extract(config):
+            state = config["state"]
+            state.extracted_info = entry.model_copy(
+                update={"document_id": state.pdf_text}
+            )
+            with lock:
+                in_flight.remove(state.pdf_text)
+            return state
+
+        entry = BigQueryEntry.model_validate(
+            BigQueryEntry.model_config["json_schema_extra"]["examples"][0]
+        )
+        mock_process_pdf.side_effect = process
+        mock_extract.side_effect = extract
+        pdf_files = [f"doc_{i}.pdf" for i in range(6)]
+
+        completed = []
+
+        # Act
+        results = asyncio.run(
+            workflow_run_batch(
+                pdf_files,
+                max_concurrency=2,
+                on_result=lambda position, result: completed.append(position),
+            )
+        )
+
+        # Assert
+        self.assertEqual(
+            [result["extracted_info"]["document_id"] for result in results],
+            pdf_files,
+        )
+        self.assertEqual(max(max_in_flight), 2)
+        self.assertEqual(sorted(completed), list(range(6)))
+
+    @patch("src.GraphModel.RESULT_CACHE")
+    @patch("src.GraphModel.pdf_cache_key")
+    def test_workflow_run_batch_given_keys(self, mock_cache_key, mock_result_cache):
+        """Test that the precomputed cache keys are used instead of hashing the PDFs again"""
+        cache_threads = []
+
+        def cache_get(key):
+            cache_threads.append(threading.current_thread())
+            return {"status": "success", "key": key}
+
+        mock_result_cache.get.side_effect = cache_get
+
+        # Act
+        results = asyncio.run(
+            workflow_run_batch(["doc_1.pdf", "doc_2.pdf"], keys=["key_1", "key_2"])
+        )
+
+        # Assert
+        self.assertEqual([result["key"] for result in results], ["key_1", "key_2"])
+        mock_cache_key.assert_not_called()
+        self.assertNotIn(
+            threading.main_thread(),
+            cache_threads,
+            "The cache should not be read on the event loop thread",
+        )
+
+
+class TestBatchExtractor(unittest.TestCase):
+    """Tests for the BatchingExtractor micro-batcher."""
+
+    def test_submit_groups_texts_in_batches(self):
+        """Test that concurrent submissions share LLM calls and get their own result"""
+        calls = []
+
+        def extract_batch(texts):
+            calls.append(list(texts))
+            return [{"document_id": text} for text in texts]
+
+        batcher = BatchingExtractor(extract_batch, batch_size=2, max_wait_ms=1000)
+        texts = ["doc_1", "doc_2", "doc_3", "doc_4"]
+
+        # Act
+        futures = [batcher.submit(text) for text in texts]
+        results = [future.result(timeout=5) for future in futures]
+
+        # Assert
+        self.assertEqual([result["document_id"] for result in results], texts)
+        self.assertEqual(calls, [["doc_1", "doc_2"], ["doc_3", "doc_4"]])
+
+    def test_submit_flushes_after_max_wait(self):
+        """Test that an incomplete batch is sent once the waiting time is over"""
+        batcher = BatchingExtractor(
+            lambda texts: [{"document_id": text} for text in texts],
+            batch_size=10,
+            max_wait_ms=10,
+        )
+
+        # Act
+        result = batcher.submit("doc_1").result(timeout=5)
+
+        # Assert
+        self.assertEqual(result, {"document_id": "doc_1"})
+
+    def test_submit_batch_size_mismatch(self):
+        """Test that every text of a batch fails when the LLM skips an entry"""
+        batcher = BatchingExtractor(
+            lambda texts: [{"document_id": "doc_1"}], batch_size=2, max_wait_ms=1000
+        )
+
+        # Act
+        futures = [batcher.submit("doc_1"), batcher.submit("doc_2")]
+
+        # Assert
+        for future in futures:
+            with self.assertRaisesRegex(ValueError, "Expected 2 extractions"):
+                future.result(timeout=5)
+
+
+class TestCache(unittest.TestCase):
+    """Tests for the content-addressed result cache."""
+
+    def setUp(self):
+        """Create the cache in a temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = ResultCache(os.path.join(self.temp_dir.name, "cache.sqlite"))
+        self.result = {"status": "success", "extracted_info": {"title": "Example"}}
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        self.temp_dir.cleanup()
+
+    def test_set_and_get(self):
+        """Test that a stored result is returned and a missing key is not"""
+        self.cache.set("key", self.result)
+
+        self.assertEqual(self.cache.get("key"), self.result)
+        self.assertIsNone(self.cache.get("missing"))
+
+    def test_expired_entry(self):
+        """Test that expired entries are not returned"""
+        self.cache.set("key", self.result, expire=-1)
+
+        self.assertIsNone(self.cache.get("key"))
+
+    def test_pdf_cache_key(self):
+        """Test that a path and a binary file with the same content share the key"""
+        content = b"%PDF-1.4 example"
+        path = os.path.join(self.temp_dir.name, "example.pdf")
+        with open(path, "wb") as f:
+            f.write(content)
+        buffer = io.BytesIO(content)
+
+        key = pdf_cache_key(buffer)
+
+        self.assertEqual(key, pdf_cache_key(path))
+        self.assertEqual(buffer.tell(), 0, "The binary file should be rewound")
+        with open(path, "rb", buffering=0) as raw_file:
+            self.assertEqual(key, pdf_cache_key(raw_file))
 
-    # Other validation tests can follow...
+
+class TestCheckpoint(unittest.TestCase):
+    """Tests for the JSONL checkpoint of the batch results."""
+
+    def setUp(self):
+        """Create the checkpoint path in a temporary directory"""
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.temp_dir.name, "results.jsonl")
+
+    def tearDown(self):
+        """Remove the temporary directory"""
+        self.temp_dir.cleanup()
+
+    def test_append_and_load_done(self):
+        """Test that appended results are found and a truncated line is ignored"""
+        self.assertEqual(load_done(self.path), set())
+
+        append_result("hash_1", {"status": "success"}, self.path)
+        append_result("hash_2", {"status": "success"}, self.path)
+        with open(self.path, "a") as f:
+            f.write('{"key": "hash_3", "res')
+
+        self.assertEqual(load_done(self.path), {"hash_1", "hash_2"})
+
+    def test_load_results(self):
+        """Test that the stored results are returned by key, the last one winning"""
+        append_result("hash_1", {"status": "success", "run": 1}, self.path)
+        append_result("hash_1", {"status": "success", "run": 2}, self.path)
+
+        self.assertEqual(
+            load_results(self.path), {"hash_1": {"status": "success", "run": 2}}
+        )
+
+    def test_remove_results(self):
+        """Test that the checkpoint is deleted, and that a missing one is ignored"""
+        append_result("hash_1", {"status": "success"}, self.path)
+
+        remove_results(self.path)
+        remove_results(self.path)
+
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(load_results(self.path), {})
 
 
 class TestBigQueryLoaderFunctions(unittest.TestCase):
     """Tests for the load_data_to_bigquery function."""
 
-    def setUp(self):
-        """Set up test data that will be used across multiple tests"""
-        self.valid_data = {
-            "extracted_info": [
-                {
-                    "document_id": "doc_2024_001",
-                    "title": "Example Document",
-                    "publication_date": "2024-01-21",
-                    "authors": ["John Doe", "Jane Smith"],
-                    "key_words": ["key1", "key2"],
-                    "key_points": ["First main point", "Second main point"],
-                    "summary": "A brief summary of the document content",
-                    "methodology": "a brief description of the methodology used",
-                    "processed_timestamp": "2024-01-21T10:00:00.000Z",
-                }
-            ]
-        }
+    @classmethod
+    def setUpClass(cls):
+        """Set up the read-only test data shared by all the tests"""
+        cls.valid_data = MappingProxyType(
+            {
+                "extracted_info": [
+                    {
+                        "document_id": "doc_2024_001",
+                        "title": "Example Document",
+                        "publication_date": "2024-01-21",
+                        "authors": ["John Doe", "Jane Smith"],
+                        "key_words": ["key1", "key2"],
+                        "key_points": ["First main point", "Second main point"],
+                        "summary": "A brief summary of the document content",
+                        "methodology": "a brief description of the methodology used",
+                        "processed_timestamp": "2024-01-21T10:00:00.000Z",
+                    }
+                ]
+            }
+        )
+
+        cls.project_id = "test-project"
+        cls.dataset_id = "test-dataset"
+        cls.table_id = "test-table"
+
+        # The records of the loader are captured by one handler for the whole class
+        cls.log_records = []
+        cls.log_handler = logging.Handler()
+        cls.log_handler.emit = cls.log_records.append
+        logging.getLogger("src.BigQueryLoader").addHandler(cls.log_handler)
 
-        self.project_id = "test-project"
-        self.dataset_id = "test-dataset"
-        self.table_id = "test-table"
+    @classmethod
+    def tearDownClass(cls):
+        """Remove the log handler of the loader"""
+        logging.getLogger("src.BigQueryLoader").removeHandler(cls.log_handler)
 
-    @patch("google.cloud.bigquery.Client")
+    def setUp(self):
+        """Every test starts without the table cached nor log records"""
+        _TABLE_CACHE.clear()
+        self.log_records.clear()
+
+    @classmethod
+    def _bq_client(cls, get_table_side_effect=None, insert_errors=()):
+        """Build a BigQuery client mock with its tables and insertion errors wired"""
+        client = MagicMock(spec_set=Client)
+        client.get_table.return_value = MagicMock(spec_set=Table)
+        client.get_table.side_effect = get_table_side_effect
+        client.create_table.return_value = MagicMock(spec_set=Table)
+        client.insert_rows_json.return_value = list(insert_errors)
+        return client
+
+    @patch("src.BigQueryLoader.bigquery.Client")
     def test_load_data_to_bigquery_success(self, mock_client):
         """Test successful data insertion into BigQuery"""
-        mock_bq_client = MagicMock()
-        mock_client.return_value = mock_bq_client
-
-        # Mock the table reference and insertion
-        mock_table = MagicMock()
-        mock_bq_client.get_table.return_value = mock_table
-        mock_bq_client.insert_rows_json.return_value = []
+        mock_bq_client = mock_client.return_value = self._bq_client()
 
         # Act
         load_data_to_bigquery(
@@ -178,22 +810,16 @@ class TestBigQueryLoaderFunctions(unittest.TestCase):
 
         # Assert
         mock_bq_client.insert_rows_json.assert_called_once_with(
-            mock_table, self.valid_data["extracted_info"]
+            mock_bq_client.get_table.return_value, self.valid_data["extracted_info"]
         )
         print("Test successful data insertion passed")
 
-    @patch("google.cloud.bigquery.Client")
+    @patch("src.BigQueryLoader.bigquery.Client")
     def test_create_table_if_not_exists(self, mock_client):
         """Test that the table is created if it doesn't exist"""
-        mock_bq_client = MagicMock()
-        mock_client.return_value = mock_bq_client
-
-        # Mock NotFound exception for table
-        mock_bq_client.get_table.side_effect = NotFound("Table not found")
-
-        # Mock the table creation
-        mock_table = MagicMock()
-        mock_bq_client.create_table.return_value = mock_table
+        mock_bq_client = mock_client.return_value = self._bq_client(
+            get_table_side_effect=NotFound("Table not found")
+        )
 
         # Act
         load_data_to_bigquery(
@@ -204,37 +830,158 @@ class TestBigQueryLoaderFunctions(unittest.TestCase):
         mock_bq_client.create_table.assert_called_once()
         print("Test table creation passed")
 
-    @patch("google.cloud.bigquery.Client")
+    @patch("src.BigQueryLoader.bigquery.Client")
     def test_insert_data_error(self, mock_client):
         """Test the error handling when insert_rows_json fails"""
-        mock_bq_client = MagicMock()
-        mock_client.return_value = mock_bq_client
+        mock_client.return_value = self._bq_client(
+            insert_errors=[{"index": 0, "errors": "Error occurred"}]
+        )
 
-        # Mock the table reference
-        mock_table = MagicMock()
-        mock_bq_client.get_table.return_value = mock_table
+        # Act
+        load_data_to_bigquery(
+            self.project_id, self.dataset_id, self.table_id, self.valid_data
+        )
 
-        # Mock the insert_rows_json to return an error
-        mock_bq_client.insert_rows_json.return_value = [
-            {"index": 0, "errors": "Error occurred"}
-        ]
+        # Assert
+        self.assertTrue(
+            any(
+                "Errors occurred while inserting rows:" in record.getMessage()
+                for record in self.log_records
+            )
+        )
+        print("Test data insertion error handling passed")
+
+    @patch("src.BigQueryLoader.bigquery.Client")
+    def test_insert_rows_in_chunks(self, mock_client):
+        """Test that large payloads are split in chunks and the table is fetched once"""
+        mock_bq_client = mock_client.return_value = self._bq_client()
+        rows = self.valid_data["extracted_info"] * 1200
+
+        # Act
+        load_data_to_bigquery(
+            self.project_id, self.dataset_id, self.table_id, {"extracted_info": rows}
+        )
+        load_data_to_bigquery(
+            self.project_id, self.dataset_id, self.table_id, {"extracted_info": rows}
+        )
+
+        # Assert
+        chunk_sizes = sorted(
+            len(call.args[1]) for call in mock_bq_client.insert_rows_json.call_args_list
+        )
+        self.assertEqual(chunk_sizes, [200, 200, 500, 500, 500, 500])
+        mock_bq_client.get_table.assert_called_once()
+
+    @patch("src.BigQueryLoader.bigquery.Client")
+    def test_table_fetched_outside_cache_lock(self, mock_client):
+        """Test that the table request does not hold the cache lock"""
+
+        def get_table(table_ref):
+            self.assertFalse(_TABLE_CACHE_LOCK.locked())
+            return DEFAULT
+
+        mock_client.return_value = self._bq_client(get_table_side_effect=get_table)
 
         # Act
-        with self.assertLogs(level="INFO") as log:
+        load_data_to_bigquery(
+            self.project_id, self.dataset_id, self.table_id, self.valid_data
+        )
+
+        # Assert
+        self.assertIn((self.project_id, self.dataset_id, self.table_id), _TABLE_CACHE)
+
+    @patch("src.BigQueryLoader.bigquery.Client")
+    def test_dropped_table_evicted(self, mock_client):
+        """Test that a table dropped outside of the process is fetched again on the next load"""
+        mock_bq_client = mock_client.return_value = self._bq_client()
+        load_data_to_bigquery(
+            self.project_id, self.dataset_id, self.table_id, self.valid_data
+        )
+        mock_bq_client.insert_rows_json.side_effect = NotFound("Table not found")
+
+        # Act
+        with self.assertRaises(NotFound):
             load_data_to_bigquery(
                 self.project_id, self.dataset_id, self.table_id, self.valid_data
             )
+        mock_bq_client.insert_rows_json.side_effect = None
+        load_data_to_bigquery(
+            self.project_id, self.dataset_id, self.table_id, self.valid_data
+        )
 
         # Assert
-        self.assertIn("Errors occurred while inserting rows:", log.output[0])
-        print("Test data insertion error handling passed")
+        self.assertEqual(mock_bq_client.get_table.call_count, 2)
+
+    @patch("src.BigQueryLoader.bigquery.Client")
+    def test_insert_batch_sizes(self, mock_client):
+        """Test that every row is streamed once whatever the size of the chunks"""
+        mock_bq_client = mock_client.return_value = self._bq_client()
+        rows = self.valid_data["extracted_info"] * 1200
+
+        for batch_size in (100, 500, 1000):
+            with self.subTest(batch_size=batch_size):
+                mock_bq_client.insert_rows_json.reset_mock()
+
+                # Act
+                load_data_to_bigquery(
+                    self.project_id,
+                    self.dataset_id,
+                    self.table_id,
+                    {"extracted_info": rows},
+                    batch_size=batch_size,
+                )
+
+                # Assert
+                chunk_sizes = [
+                    len(call.args[1])
+                    for call in mock_bq_client.insert_rows_json.call_args_list
+                ]
+                self.assertEqual(len(chunk_sizes), math.ceil(len(rows) / batch_size))
+                self.assertEqual(sum(chunk_sizes), len(rows))
+                self.assertLessEqual(max(chunk_sizes), batch_size)
+
+    @patch("src.BigQueryLoader.bigquery.Client")
+    def test_invalid_batch_size(self, mock_client):
+        """Test that a batch size below one is rejected before any request"""
+        for batch_size in (0, -1):
+            with self.subTest(batch_size=batch_size):
+                with self.assertRaisesRegex(ValueError, "positive integer"):
+                    load_data_to_bigquery(
+                        self.project_id,
+                        self.dataset_id,
+                        self.table_id,
+                        self.valid_data,
+                        batch_size=batch_size,
+                    )
+        mock_client.assert_not_called()
+
+    @patch("src.BigQueryLoader.bigquery.Client")
+    def test_load_data_to_bigquery_batch(self, mock_client):
+        """Test that the batch loader sends every row in one newline-delimited JSON load job"""
+        mock_bq_client = mock_client.return_value = self._bq_client()
+        rows = self.valid_data["extracted_info"] * 3
 
+        # Act
+        load_data_to_bigquery_batch(
+            self.project_id, self.dataset_id, self.table_id, {"extracted_info": rows}
+        )
 
-if __name__ == "__main__":
-    suite = unittest.TestSuite()
-    suite.addTests(
-        unittest.TestLoader().loadTestsFromTestCase(TestBigQueryLoaderFunctions)
-    )
-    suite.addTests(unittest.TestLoader().loadTestsFromTestCase(TestLlmModelFunctions))
+        # Assert
+        mock_bq_client.load_table_from_file.assert_called_once()
+        payload, table_ref = mock_bq_client.load_table_from_file.call_args.args
+        job_config = mock_bq_client.load_table_from_file.call_args.kwargs["job_config"]
+        self.assertEqual(
+            [json.loads(line) for line in payload.getvalue().splitlines()], rows
+        )
+        self.assertEqual(table_ref.table_id, self.table_id)
+        self.assertEqual(
+            job_config.source_format, bigquery.SourceFormat.NEWLINE_DELIMITED_JSON
+        )
+        self.assertEqual(
+            job_config.write_disposition, bigquery.WriteDisposition.WRITE_APPEND
+        )
+        mock_bq_client.insert_rows_json.assert_not_called()
 
-    unittest.TextTestRunner().run(suite)
+
+if __name__ == "__main__":
+    unittest.main()